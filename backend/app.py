@@ -1,29 +1,43 @@
 import numpy as np
 from flask import Flask, request, jsonify, redirect, session, url_for
 from flask_cors import CORS
-from flask_session import Session
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
-from sklearn.preprocessing import StandardScaler
 from sklearn.metrics.pairwise import cosine_similarity
-from scipy.spatial.distance import cdist
 import os
 from dotenv import load_dotenv
 from urllib.parse import urlparse
 import traceback
 import random
 from spotipy.exceptions import SpotifyException
-import pandas as pd
-import ast
 from collections import defaultdict
+from features import load_or_build_features
+from neighbors import build_index
+from knn_graph import load_knn_graph
+from recommendation_cache import RecommendationCache
+from dataset import DATA_PATH, CACHE_DIR, load_dataset
+from search_index import TrackSearchIndex
+from serialization import TRACK_FIELDS, encode_json, song_records, spotify_track_records
+from spotify_cache import CacheStats, CachedSpotify, create_cache, user_cache_key
+from concurrency import FanOut, call, fetch_all_pages
+from audio_features import AudioFeatureService
+from spotify_client import PooledSpotify, TokenRefresher, connection_stats, create_session
+from rate_limit import PRIORITY_BACKGROUND, PRIORITY_DEFAULT, PRIORITY_SEARCH, RateLimiter
+from session_store import compact_token, configure_sessions
+from genres import GenreCentroids
 
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True)  # Permet les cookies avec CORS
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'votre_clé_secrète')  # Remplacez par une clé secrète sécurisée
-app.config['SESSION_TYPE'] = 'filesystem'
-Session(app)  # Initialise la gestion des sessions
+# Sessions : 'memory' (un processus), 'redis' (plusieurs processus) ou 'filesystem'
+configure_sessions(
+    app,
+    os.getenv('UTA_SESSION_STORE', 'memory'),
+    redis_url=os.getenv('REDIS_URL'),
+    max_bytes=int(os.getenv('UTA_SESSION_MEMORY_MB', 16)) * 1024 * 1024
+)
 
 # Configurations Spotify
 SPOTIPY_CLIENT_ID = os.getenv('SPOTIPY_CLIENT_ID')
@@ -52,115 +66,180 @@ sp_oauth = SpotifyOAuth(
     ]
 )
 
+# Rafraîchissement des tokens : un seul appel par utilisateur, en avance (UTA_TOKEN_REFRESH_MARGIN secondes)
+token_refresher = TokenRefresher(sp_oauth, margin=int(os.getenv('UTA_TOKEN_REFRESH_MARGIN', 300)))
+
+# Cache des réponses de l'API Spotify : 'memory' (par processus), 'redis' (partagé) ou 'none'
+spotify_cache = create_cache(
+    os.getenv('UTA_SPOTIFY_CACHE', 'memory'),
+    redis_url=os.getenv('REDIS_URL'),
+    max_bytes=int(os.getenv('UTA_SPOTIFY_CACHE_MB', 64)) * 1024 * 1024
+)
+spotify_cache_stats = CacheStats()
+
+# Appels Spotify indépendants exécutés en parallèle : nombre de threads partagés, délai par appel HTTP
+# et budget de temps total par groupe d'appels (les appels en retard sont ignorés)
+SPOTIFY_REQUESTS_TIMEOUT = float(os.getenv('UTA_SPOTIFY_TIMEOUT', 5))
+spotify_fan_out = FanOut(
+    max_workers=int(os.getenv('UTA_SPOTIFY_CONCURRENCY', 16)),
+    timeout=float(os.getenv('UTA_SPOTIFY_BUDGET', 8))
+)
+# Connexions HTTP keep-alive vers l'API Spotify partagées par toutes les requêtes
+spotify_session = create_session(
+    pool_size=int(os.getenv('UTA_SPOTIFY_POOL_SIZE', 32)),
+    retries=int(os.getenv('UTA_SPOTIFY_RETRIES', 3)),
+    backoff_factor=float(os.getenv('UTA_SPOTIFY_BACKOFF', 0.3))
+)
+# Limiteur de débit partagé par tous les appels Spotify (appels/seconde, rafale, attente maximale)
+spotify_limiter = RateLimiter(
+    rate=float(os.getenv('UTA_SPOTIFY_RATE', 20)),
+    burst=int(os.getenv('UTA_SPOTIFY_BURST', 40)),
+    max_wait=float(os.getenv('UTA_SPOTIFY_MAX_WAIT', 10))
+)
+# URL de l'API Spotify, modifiable pour viser un serveur local (voir spotify_stub.py)
+SPOTIFY_API_URL = os.getenv('UTA_SPOTIFY_API_URL')
+
 # Charger le dataset
-data_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'exploration', 'Version_finale', 'data', 'data.csv')
-data = pd.read_csv(data_path)
+data_path = DATA_PATH
+cache_dir = CACHE_DIR
+# Chargé une seule fois depuis le cache binaire (reconstruit si data.csv a changé), jamais modifié par les requêtes
+dataset = load_dataset(data_path, os.path.join(cache_dir, 'dataset'))
+
+# Matrice des caractéristiques standardisées, calculée une seule fois et partagée par toutes les requêtes
+features = load_or_build_features(dataset.frame, os.path.join(cache_dir, 'features'), dataset.signature)
+
+# Index n-grammes des titres et artistes pour la recherche dans le dataset
+search_index = TrackSearchIndex(dataset.frame['name'], dataset.artists,
+                                dataset.frame['popularity'] if 'popularity' in dataset.frame else None)
+
+# Index de plus proches voisins : 'exact' (force brute), 'ivf' (approximatif, rappel réglable via UTA_IVF_NPROBE)
+# ou 'year' (partitions par année, seules les UTA_IVF_NPROBE années les plus proches sont parcourues)
+# ou 'sharded' (exact, réparti sur UTA_NN_WORKERS processus, par défaut un par cœur)
+nn_index = build_index(
+    os.getenv('UTA_NN_INDEX', 'exact'),
+    features,
+    cache_dir=cache_dir,
+    n_lists=int(os.getenv('UTA_IVF_NLISTS', 0)) or None,
+    n_probe=int(os.getenv('UTA_IVF_NPROBE', 16)),
+    years=dataset.frame['year'].to_numpy(),
+    workers=int(os.getenv('UTA_NN_WORKERS', 0)) or None
+)
 
-def get_song_data(song, spotify_data):
-    try:
-        name = song['name']
-        year = song['year']
-        mask = (spotify_data['name'].str.lower() == name.lower()) & (spotify_data['year'] == year)
-        return spotify_data[mask].iloc[0]
-    except:
-        return None
+# Graphe des plus proches voisins précalculé (build_knn_graph.py), utilisé pour 1 à UTA_KNN_MAX_SEEDS chansons d'entrée
+knn_graph = load_knn_graph(os.path.join(cache_dir, 'knn'), features)
+KNN_MAX_SEEDS = int(os.getenv('UTA_KNN_MAX_SEEDS', 2))
 
-def get_mean_vector(song_list, spotify_data):
-    song_vectors = []
-    
-    # Caractéristiques numériques à utiliser
-    number_cols = ['valence', 'year', 'acousticness', 'danceability', 'duration_ms', 'energy',
-                  'instrumentalness', 'key', 'liveness', 'loudness', 'mode', 'speechiness', 'tempo']
-    
+# Résultats des recommandations du dataset par liste de chansons d'entrée (0 entrée : cache désactivé)
+recommendation_cache = RecommendationCache(
+    dataset.signature,
+    max_entries=int(os.getenv('UTA_RECOMMENDATION_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('UTA_RECOMMENDATION_CACHE_TTL', 3600))
+)
+
+# Centroïdes des genres (data_by_genres.csv) : recommandations par genre calculées localement
+genre_centroids = GenreCentroids.load(features)
+
+# Caractéristiques audio des pistes Spotify : data.csv, puis cache par piste, puis API par lots de 100
+audio_feature_service = AudioFeatureService(dataset, spotify_cache, spotify_fan_out)
+
+# Nombre maximum de listes de chansons par appel à /get_dataset_recommendations_batch
+MAX_BATCH_SIZE = 1000
+# Nombre maximum de recommandations par liste (n_songs)
+MAX_N_SONGS = 100
+
+def get_song_rows(song_list, lookup):
+    """
+    Retrouve la ligne du dataset de chaque chanson d'entrée via l'index (nom, année) / id
+    """
+    rows = []
     for song in song_list:
-        song_data = get_song_data(song, spotify_data)
-        if song_data is None:
-            print(f'Warning: {song["name"]} does not exist in the database')
+        row = lookup.find(song)
+        if row is None:
+            print(f'Warning: {song.get("name")} does not exist in the database')
             continue
-        song_vector = song_data[number_cols].values
-        song_vectors.append(song_vector)
-    
-    if not song_vectors:
-        return None
-    
-    song_matrix = np.array(list(song_vectors))
-    return np.mean(song_matrix, axis=0)
+        rows.append(row)
+    return rows
 
-def recommend_songs(song_list, spotify_data, n_songs=9):
+def score_seed_lists(row_lists, dataset, features, index, n_songs, knn_graph=None):
     """
-    Recommande des chansons basées sur les chansons d'entrée en utilisant les caractéristiques musicales
+    Lignes des n_songs chansons les plus proches du vecteur moyen de chaque liste de lignes (non vides) :
+    les vecteurs moyens des K listes sont comparés au dataset par un seul produit matriciel.
+    Avec knn_graph, les listes d'au plus KNN_MAX_SEEDS chansons fusionnent les voisins précalculés
+    de leurs chansons au lieu de parcourir le dataset.
     """
-    # Colonnes de métadonnées et caractéristiques numériques
-    metadata_cols = ['name', 'year', 'artists']
-    number_cols = ['valence', 'year', 'acousticness', 'danceability', 'duration_ms', 'energy',
-                  'instrumentalness', 'key', 'liveness', 'loudness', 'mode', 'speechiness', 'tempo']
-    
-    # Convertir la colonne artists de string à liste si ce n'est pas déjà fait
-    if isinstance(spotify_data.iloc[0]['artists'], str):
-        spotify_data['artists'] = spotify_data['artists'].apply(ast.literal_eval)
-    
-    # Obtenir le vecteur moyen des chansons d'entrée
-    song_center = get_mean_vector(song_list, spotify_data)
-    input_songs_data = []
-    for song in song_list:
-        song_data = get_song_data(song, spotify_data)
-        if song_data is not None:
-            input_songs_data.append({
-                'name': song_data['name'],
-                'year': int(song_data['year']),
-                'artists': song_data['artists'],
-                'valence': float(song_data['valence']),
-                'acousticness': float(song_data['acousticness']),
-                'danceability': float(song_data['danceability']),
-                'energy': float(song_data['energy']),
-                'instrumentalness': float(song_data['instrumentalness']),
-                'liveness': float(song_data['liveness']),
-                'loudness': float(song_data['loudness']),
-                'speechiness': float(song_data['speechiness']),
-                'tempo': float(song_data['tempo'])
-            })
+    recommended = [None] * len(row_lists)
+
+    # Vecteurs moyens des chansons d'entrée, directement dans l'espace standardisé
+    song_centers = np.stack([features.matrix[list(rows)].mean(axis=0, dtype=np.float64) for rows in row_lists])
+
+    # Exclure les chansons d'entrée (et leurs doublons de même nom et même année, précalculés par l'index)
+    excluded = [np.concatenate([dataset.lookup.same_song(row) for row in rows]) for rows in row_lists]
+
+    # Peu de chansons d'entrée : voisins précalculés (si les listes suffisent à remplir le top n)
+    scanned = []
+    for position, rows in enumerate(row_lists):
+        found = None
+        if knn_graph is not None and len(rows) <= KNN_MAX_SEEDS:
+            found = knn_graph.search(list(rows), song_centers[position], n_songs, excluded[position])
+        if found is None:
+            scanned.append(position)
+        else:
+            recommended[position] = found[0]
+
+    # Sélectionner les chansons les plus proches (distance cosinus) via l'index
+    if scanned:
+        results = index.search_batch(song_centers[scanned], n_songs, [excluded[p] for p in scanned])
+        for position, (indices, _) in zip(scanned, results):
+            recommended[position] = indices
+
+    for indices in recommended:
+        # Résultats éventuellement partagés par le cache entre plusieurs requêtes
+        indices.flags.writeable = False
+    return recommended
+
+def recommend_songs_batch(song_lists, dataset, features, index, n_songs=9, knn_graph=None, cache=None):
+    """
+    Recommande des chansons pour plusieurs listes de chansons d'entrée en une seule fois.
+    Ne modifie jamais le dataset partagé : tout le calcul se fait sur des tableaux locaux à la requête,
+    la fonction peut donc être appelée en parallèle (serveur multi-thread).
+    Avec cache (RecommendationCache), seules les listes absentes du cache sont calculées.
+    Retourne une liste de (recommandations, chansons d'entrée) dans l'ordre des listes.
+    """
+    # Retrouver les chansons d'entrée une seule fois, pour le vecteur moyen et la réponse
+    all_rows = [get_song_rows(song_list, dataset.lookup) for song_list in song_lists]
+    recommended = [None] * len(song_lists)
+
+    seeded = [i for i, rows in enumerate(all_rows) if rows]
+    if seeded:
+        if cache is None:
+            found = score_seed_lists([all_rows[i] for i in seeded], dataset, features, index, n_songs, knn_graph)
+        else:
+            # La clé contient les lignes triées : le calcul se fait sur les lignes de la clé
+            found = cache.get_many(
+                [cache.key(all_rows[i], n_songs) for i in seeded],
+                lambda keys: score_seed_lists([key[2] for key in keys], dataset, features, index, n_songs,
+                                              knn_graph)
+            )
+        for i, indices in zip(seeded, found):
+            recommended[i] = indices
 
-    if song_center is None:
-        # Si aucune chanson d'entrée n'est trouvée, retourner des recommandations aléatoires
-        recommendations = spotify_data.sample(n=n_songs)
-    else:
-        # Normaliser les caractéristiques
-        scaler = StandardScaler()
-        scaled_data = scaler.fit_transform(spotify_data[number_cols])
-        scaled_song_center = scaler.transform(song_center.reshape(1, -1))
-        
-        # Calculer les distances
-        distances = cdist(scaled_data, scaled_song_center, 'cosine').reshape(-1)
-        
-        # Créer un masque pour exclure les chansons d'entrée
-        song_names = [song['name'].lower() for song in song_list]
-        song_years = [song['year'] for song in song_list]
-        mask = ~((spotify_data['name'].str.lower().isin(song_names)) & 
-                (spotify_data['year'].isin(song_years)))
-        
-        # Trier par similarité (1 - distance) et sélectionner les meilleures recommandations
-        spotify_data['distances'] = distances
-        recommendations = spotify_data[mask].nsmallest(n_songs, 'distances')
-    
-    # Formater les résultats
     results = []
-    for _, song in recommendations.iterrows():
-        results.append({
-            'name': song['name'],
-            'year': int(song['year']),
-            'artists': song['artists'],
-            'valence': float(song['valence']),
-            'acousticness': float(song['acousticness']),
-            'danceability': float(song['danceability']),
-            'energy': float(song['energy']),
-            'instrumentalness': float(song['instrumentalness']),
-            'liveness': float(song['liveness']),
-            'loudness': float(song['loudness']),
-            'speechiness': float(song['speechiness']),
-            'tempo': float(song['tempo'])
-        })
-    
-    return results, input_songs_data
+    for rows, indices in zip(all_rows, recommended):
+        if indices is None:
+            # Si aucune chanson d'entrée n'est trouvée, retourner des recommandations aléatoires
+            indices = np.random.choice(len(dataset), n_songs, replace=False)
+        results.append((song_records(dataset, indices), song_records(dataset, rows)))
+    return results
+
+def recommend_songs(song_list, dataset, features, index, n_songs=9, knn_graph=None, cache=None):
+    """
+    Recommande des chansons basées sur les chansons d'entrée en utilisant les caractéristiques musicales
+    """
+    return recommend_songs_batch([song_list], dataset, features, index, n_songs, knn_graph, cache)[0]
+
+def json_response(payload, status=200):
+    """Réponse JSON encodée avec msgspec, pour les réponses volumineuses issues du dataset"""
+    return app.response_class(encode_json(payload), status=status, mimetype='application/json')
 
 @app.route('/login')
 def login():
@@ -217,20 +296,55 @@ def callback():
         print(f"Error obtaining access token: {e}")
         return jsonify({'error': 'Failed to obtain access token'}), 500
 
-    session['token_info'] = token_info
+    session['token_info'] = compact_token(token_info)
     return redirect('http://localhost:3000/home')
 
-def get_spotify_client():
+def get_token_info():
+    """Token de l'utilisateur de la session, rafraîchi si nécessaire, ou None s'il n'est pas connecté"""
     token_info = session.get('token_info', {})
     if not token_info:
         return None
 
-    # Vérifier si le token a expiré
-    if sp_oauth.is_token_expired(token_info):
-        token_info = sp_oauth.refresh_access_token(token_info['refresh_token'])
-        session['token_info'] = token_info
+    # Token rafraîchi si nécessaire (une seule fois pour toutes les requêtes concurrentes de l'utilisateur)
+    try:
+        fresh_token_info = token_refresher.current(token_info)
+    except Exception as e:
+        print(f"Error refreshing access token: {e}")
+        return None
+    if fresh_token_info is not token_info:
+        token_info = session['token_info'] = compact_token(fresh_token_info)
+    return token_info
+
+def get_spotify_client(priority=PRIORITY_DEFAULT):
+    token_info = get_token_info()
+    if not token_info:
+        return None
+
+    client = PooledSpotify(auth=token_info['access_token'], requests_session=spotify_session,
+                           requests_timeout=SPOTIFY_REQUESTS_TIMEOUT, limiter=spotify_limiter, priority=priority)
+    if SPOTIFY_API_URL:
+        client.prefix = SPOTIFY_API_URL
+    return CachedSpotify(client, spotify_cache, user_cache_key(token_info), spotify_cache_stats)
+
+def get_user_market(sp):
+    """Pays de l'utilisateur, demandé une seule fois à Spotify puis gardé dans la session"""
+    market = session.get('market')
+    if market is None:
+        market = session['market'] = sp.current_user()['country']
+    return market
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    sp = get_spotify_client()
+    if not sp:
+        return jsonify({'error': 'User not authenticated'}), 401
 
-    return spotipy.Spotify(auth=token_info['access_token'])
+    return jsonify({
+        'spotify': spotify_cache_stats.snapshot(),
+        'connections': connection_stats(spotify_session),
+        'rate_limit': spotify_limiter.snapshot(),
+        'recommendations': recommendation_cache.snapshot()
+    })
 
 @app.route('/logout')
 def logout():
@@ -250,6 +364,14 @@ def current_user():
         print(f"Error fetching current user: {e}")
         return jsonify({'authenticated': False, 'error': str(e)}), 500
 
+def format_playlist(item):
+    return {
+        'name': item['name'],
+        'id': item['id'],
+        'url': item['external_urls']['spotify'],
+        'owner': item['owner']['display_name']
+    }
+
 @app.route('/get_playlists', methods=['GET'])
 def get_playlists():
     sp = get_spotify_client()
@@ -257,21 +379,14 @@ def get_playlists():
         return jsonify({'error': 'User not authenticated'}), 401
 
     try:
-        playlists = []
-        results = sp.current_user_playlists()
-        while results:
-            for item in results['items']:
-                playlists.append({
-                    'name': item['name'],
-                    'id': item['id'],
-                    'url': item['external_urls']['spotify'],
-                    'owner': item['owner']['display_name']
-                })
-            if results['next']:
-                results = sp.next(results)
-            else:
-                results = None
-        return jsonify(playlists)
+        # Première page, puis toutes les suivantes en parallèle
+        items = fetch_all_pages(
+            spotify_fan_out,
+            sp.current_user_playlists(limit=50),
+            lambda offset, limit: sp.current_user_playlists(limit=limit, offset=offset),
+            "les playlists"
+        )
+        return jsonify([format_playlist(item) for item in items])
     except Exception as e:
         print(f"Error fetching playlists: {e}")
         print(traceback.format_exc())
@@ -299,6 +414,38 @@ def get_playlist_image():
         print(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+PLAYLIST_TRACK_FIELDS = 'items(track(id,name,artists(name),album(name),preview_url,external_urls))'
+
+def format_playlist_details(playlist, tracks_page, page, per_page):
+    total_tracks = playlist['tracks']['total']
+    tracks = []
+    for item in tracks_page['items']:
+        track = item.get('track')
+        if track:  # Vérifier que la piste existe (pas été supprimée)
+            try:
+                tracks.append({
+                    'id': track.get('id', ''),
+                    'name': track.get('name', 'Unknown Title'),
+                    'artist': ', '.join(artist.get('name', 'Unknown Artist') for artist in track.get('artists', [])),
+                    'album': track.get('album', {}).get('name', 'Unknown Album'),
+                    'preview_url': track.get('preview_url'),
+                    'external_url': track.get('external_urls', {}).get('spotify', '')
+                })
+            except Exception as track_error:
+                print(f"Error processing track: {track_error}")
+                continue  # Passer à la piste suivante en cas d'erreur
+
+    return {
+        'playlist_name': playlist.get('name', 'Unknown Playlist'),
+        'tracks': tracks,
+        'pagination': {
+            'total': total_tracks,
+            'per_page': per_page,
+            'current_page': page,
+            'total_pages': (total_tracks + per_page - 1) // per_page
+        }
+    }
+
 @app.route('/get_playlist_details', methods=['GET'])
 def get_playlist_details():
     sp = get_spotify_client()
@@ -316,43 +463,16 @@ def get_playlist_details():
     try:
         # Récupérer les informations de base de la playlist
         playlist = sp.playlist(playlist_id, fields='name,tracks.total')
-        total_tracks = playlist['tracks']['total']
         
         # Récupérer la page demandée
         tracks_page = sp.playlist_tracks(
             playlist_id,
             offset=offset,
             limit=per_page,
-            fields='items(track(id,name,artists(name),album(name),preview_url,external_urls))'
+            fields=PLAYLIST_TRACK_FIELDS
         )
         
-        tracks = []
-        for item in tracks_page['items']:
-            track = item.get('track')
-            if track:  # Vérifier que la piste existe (pas été supprimée)
-                try:
-                    tracks.append({
-                        'id': track.get('id', ''),
-                        'name': track.get('name', 'Unknown Title'),
-                        'artist': ', '.join(artist.get('name', 'Unknown Artist') for artist in track.get('artists', [])),
-                        'album': track.get('album', {}).get('name', 'Unknown Album'),
-                        'preview_url': track.get('preview_url'),
-                        'external_url': track.get('external_urls', {}).get('spotify', '')
-                    })
-                except Exception as track_error:
-                    print(f"Error processing track: {track_error}")
-                    continue  # Passer à la piste suivante en cas d'erreur
-
-        return jsonify({
-            'playlist_name': playlist.get('name', 'Unknown Playlist'),
-            'tracks': tracks,
-            'pagination': {
-                'total': total_tracks,
-                'per_page': per_page,
-                'current_page': page,
-                'total_pages': (total_tracks + per_page - 1) // per_page
-            }
-        })
+        return jsonify(format_playlist_details(playlist, tracks_page, page, per_page))
     except spotipy.exceptions.SpotifyException as e:
         error_message = f"SpotifyException: {str(e)}"
         print(error_message)
@@ -365,6 +485,143 @@ def get_playlist_details():
         return jsonify({'error': error_message}), 500
 
 
+def listening_calls(market):
+    """Appels Spotify de la première étape de /get_recommendations (le profil seulement si le pays est inconnu)"""
+    calls = [
+        call("l'historique d'écoute", 'current_user_recently_played', limit=50),
+        call("les top artistes", 'current_user_top_artists', limit=20, time_range='medium_term'),
+    ]
+    if market is None:
+        calls.append(call("le profil utilisateur", 'current_user'))
+    return calls
+
+def bind_calls(sp, calls):
+    """Associe les noms de méthodes d'une liste d'appels aux méthodes du client Spotify (synchrone ou asynchrone)"""
+    return [(description, getattr(sp, name), args, kwargs) for description, name, args, kwargs in calls]
+
+def summarize_listening(recent_tracks, top_artists_data):
+    """Historique d'écoute formaté, ids déjà écoutés, top artistes et top genres de l'utilisateur"""
+    # Formater l'historique d'écoute
+    recent_tracks_formatted = []
+    recent_track_ids = set()
+    artist_counts = {}
+    genre_counts = {}
+    
+    # Traiter l'historique récent
+    for item in recent_tracks['items']:
+        track = item['track']
+        recent_track_ids.add(track['id'])
+        recent_tracks_formatted.append({
+            'id': track['id'],
+            'name': track['name'],
+            'artists': [artist['name'] for artist in track['artists']],
+            'album': track['album']['name']
+        })
+        
+        # Compter les artistes et genres
+        for artist in track['artists']:
+            artist_id = artist['id']
+            if artist_id not in artist_counts:
+                artist_counts[artist_id] = {
+                    'count': 1,
+                    'name': artist['name']
+                }
+            else:
+                artist_counts[artist_id]['count'] += 1
+
+    # Collecter les genres des top artistes
+    for artist in top_artists_data['items']:
+        for genre in artist['genres']:
+            genre_counts[genre] = genre_counts.get(genre, 0) + 1
+
+    # Obtenir les top artistes et genres
+    top_artists = sorted(artist_counts.items(), key=lambda x: x[1]['count'], reverse=True)[:8]
+    top_genres = sorted(genre_counts.items(), key=lambda x: x[1], reverse=True)[:8]
+    return recent_tracks_formatted, recent_track_ids, top_artists, top_genres
+
+def recommendation_calls(top_artists_data, recent_tracks_formatted, top_artists, top_genres, market,
+                         min_popularity, max_popularity):
+    """
+    Appels Spotify indépendants de la deuxième étape de /get_recommendations,
+    et pour chacun le nombre de pistes à garder et la source affichée
+    """
+    calls, sources = [], []
+    
+    # À partir des top artistes de l'utilisateur
+    for artist in top_artists_data['items']:
+        calls.append(call(f"les tracks de {artist['name']}", 'artist_top_tracks', artist['id'], country=market))
+        sources.append((5, f"Top artiste: {artist['name']}"))  # Réduit de 10 à 5 pour avoir plus de variété
+
+    # À partir des genres et artistes
+    seed_artists = [artist_id for artist_id, _ in top_artists[:4]]
+    seed_genres = [genre for genre, _ in top_genres[:5]]
+    
+    # Faire plusieurs appels avec différents paramètres pour plus de variété
+    for i in range(2):  # Faire 2 appels différents
+        if not (seed_artists[i:i+2] or seed_genres[i:i+3]):
+            break
+        calls.append(call(
+            "les recommendations",
+            'recommendations',
+            seed_artists=seed_artists[i:i+2],  # Utiliser différents artistes à chaque fois
+            seed_genres=seed_genres[i:i+3],    # Utiliser différents genres à chaque fois
+            limit=20,  # Réduit de 30 à 20
+            market=market,
+            min_popularity=min_popularity,
+            max_popularity=max_popularity
+        ))
+        sources.append((20, "Recommendation basée sur vos goûts"))
+
+    # Rechercher des tracks similaires aux dernières écoutes
+    for recent_track in recent_tracks_formatted[:5]:  # Réduit de 10 à 5
+        calls.append(call(
+            f"les similaires de {recent_track['name']}",
+            'recommendations',
+            seed_tracks=[recent_track['id']],
+            limit=5,  # Réduit de 10 à 5
+            market=market,
+            min_popularity=min_popularity
+        ))
+        sources.append((5, f"Similaire à: {recent_track['name']}"))
+    return calls, sources
+
+def collect_tracks(results, sources, excluded_ids=()):
+    """Pistes des appels réussis (les appels échoués ou trop lents sont ignorés), avec leur source"""
+    similar_tracks = []
+    for result, (count, source) in zip(results, sources):
+        if result is None:
+            continue
+        for track in result['tracks'][:count]:
+            if track['id'] not in excluded_ids:
+                similar_tracks.append({
+                    'track': track,
+                    'source': source
+                })
+    return similar_tracks
+
+def format_recommendations(similar_tracks, limit, recent_tracks_formatted, top_artists, top_genres):
+    # Mélanger et sélectionner le nombre de recommandations demandé
+    random.shuffle(similar_tracks)
+    recommendations = similar_tracks[:limit]  # Utiliser le paramètre limit au lieu de 80
+
+    # Formater la réponse
+    formatted_response = {
+        'tracks': [item['track'] for item in recommendations],
+        'based_on': {
+            'recent_tracks': recent_tracks_formatted[:10],
+            'top_artists': [{'name': info['name'], 'count': info['count']} for _, info in top_artists],
+            'top_genres': [{'name': genre, 'count': count} for genre, count in top_genres]
+        }
+    }
+
+    print(f"Recommendations: {formatted_response}")
+    preview_count = sum(1 for item in recommendations if item['track']['preview_url'] is not None)
+    print(f"Nombre de previews disponibles : {preview_count}/{len(recommendations)}")
+    return formatted_response
+
+def popularity_range(target_popularity):
+    return max(0, target_popularity - 10), min(100, target_popularity + 10)
+
 @app.route('/get_recommendations', methods=['GET'])
 def get_recommendations():
     sp = get_spotify_client()
@@ -374,134 +631,25 @@ def get_recommendations():
     try:
         target_popularity = int(request.args.get('target_popularity', 50))
         limit = int(request.args.get('limit', 10))  # Récupérer le paramètre limit avec une valeur par défaut de 10
-        min_popularity = max(0, target_popularity - 10)
-        max_popularity = min(100, target_popularity + 10)
-
-        # Récupérer le pays de l'utilisateur
-        user_info = sp.current_user()
-        market = user_info['country']
-
-        # 1. Récupérer l'historique d'écoute récent et les top artistes
-        recent_tracks = sp.current_user_recently_played(limit=50)
-        top_artists_data = sp.current_user_top_artists(limit=20, time_range='medium_term')
-        
-        # Formater l'historique d'écoute
-        recent_tracks_formatted = []
-        recent_track_ids = set()
-        artist_counts = {}
-        genre_counts = {}
-        
-        # Traiter l'historique récent
-        for item in recent_tracks['items']:
-            track = item['track']
-            recent_track_ids.add(track['id'])
-            recent_tracks_formatted.append({
-                'id': track['id'],
-                'name': track['name'],
-                'artists': [artist['name'] for artist in track['artists']],
-                'album': track['album']['name']
-            })
-            
-            # Compter les artistes et genres
-            for artist in track['artists']:
-                artist_id = artist['id']
-                if artist_id not in artist_counts:
-                    artist_counts[artist_id] = {
-                        'count': 1,
-                        'name': artist['name']
-                    }
-                else:
-                    artist_counts[artist_id]['count'] += 1
-
-        # Collecter les genres des top artistes
-        for artist in top_artists_data['items']:
-            for genre in artist['genres']:
-                genre_counts[genre] = genre_counts.get(genre, 0) + 1
-
-        # Obtenir les top artistes et genres
-        top_artists = sorted(artist_counts.items(), key=lambda x: x[1]['count'], reverse=True)[:8]
-        top_genres = sorted(genre_counts.items(), key=lambda x: x[1], reverse=True)[:8]
-        
-        # Collecter des pistes similaires
-        similar_tracks = []
-        
-        # À partir des top artistes de l'utilisateur
-        for artist in top_artists_data['items']:
-            try:
-                top_tracks = sp.artist_top_tracks(artist['id'], country=market)['tracks']
-                for track in top_tracks[:5]:  # Réduit de 10 à 5 pour avoir plus de variété
-                    if track['id'] not in recent_track_ids:
-                        similar_tracks.append({
-                            'track': track,
-                            'source': f"Top artiste: {artist['name']}"
-                        })
-            except Exception as e:
-                print(f"Erreur lors de la récupération des tracks pour {artist['name']}: {e}")
-                continue
-
-        # À partir des genres et artistes
-        seed_artists = [artist_id for artist_id, _ in top_artists[:4]]
-        seed_genres = [genre for genre, _ in top_genres[:5]]
-        
-        try:
-            # Faire plusieurs appels avec différents paramètres pour plus de variété
-            for i in range(2):  # Faire 2 appels différents
-                recommendations_results = sp.recommendations(
-                    seed_artists=seed_artists[i:i+2],  # Utiliser différents artistes à chaque fois
-                    seed_genres=seed_genres[i:i+3],    # Utiliser différents genres à chaque fois
-                    limit=20,  # Réduit de 30 à 20
-                    market=market,
-                    min_popularity=min_popularity,
-                    max_popularity=max_popularity
-                )
-                
-                for track in recommendations_results['tracks']:
-                    if track['id'] not in recent_track_ids:
-                        similar_tracks.append({
-                            'track': track,
-                            'source': f"Recommendation basée sur vos goûts"
-                        })
-        except Exception as e:
-            print(f"Erreur lors de la récupération des recommendations: {e}")
-
-        # Rechercher des tracks similaires aux dernières écoutes
-        for recent_track in recent_tracks_formatted[:5]:  # Réduit de 10 à 5
-            try:
-                seed_track = recent_track['id']
-                results = sp.recommendations(
-                    seed_tracks=[seed_track],
-                    limit=5,  # Réduit de 10 à 5
-                    market=market,
-                    min_popularity=min_popularity
-                )
-                for track in results['tracks']:
-                    if track['id'] not in recent_track_ids:
-                        similar_tracks.append({
-                            'track': track,
-                            'source': f"Similaire à: {recent_track['name']}"
-                        })
-            except Exception as e:
-                print(f"Erreur lors de la recherche de similaires pour {recent_track['name']}: {e}")
-                continue
-
-        # Mélanger et sélectionner le nombre de recommandations demandé
-        random.shuffle(similar_tracks)
-        recommendations = similar_tracks[:limit]  # Utiliser le paramètre limit au lieu de 80
-
-        # Formater la réponse
-        formatted_response = {
-            'tracks': [item['track'] for item in recommendations],
-            'based_on': {
-                'recent_tracks': recent_tracks_formatted[:10],
-                'top_artists': [{'name': info['name'], 'count': info['count']} for _, info in top_artists],
-                'top_genres': [{'name': genre, 'count': count} for genre, count in top_genres]
-            }
-        }
-
-        print(f"Recommendations: {formatted_response}")
-        preview_count = sum(1 for item in recommendations if item['track']['preview_url'] is not None)
-        print(f"Nombre de previews disponibles : {preview_count}/{len(recommendations)}")
-        return jsonify(formatted_response)
+        min_popularity, max_popularity = popularity_range(target_popularity)
+
+        # 1. Récupérer le pays de l'utilisateur (s'il n'est pas déjà en session),
+        # l'historique d'écoute récent et les top artistes en parallèle
+        market = session.get('market')
+        recent_tracks, top_artists_data, *user_info = spotify_fan_out.run(bind_calls(sp, listening_calls(market)))
+        if recent_tracks is None and top_artists_data is None:
+            return jsonify({'error': 'Spotify API unavailable'}), 502
+        if user_info and user_info[0]:
+            market = session['market'] = user_info[0]['country']
+        recent_tracks_formatted, recent_track_ids, top_artists, top_genres = summarize_listening(
+            recent_tracks or {'items': []}, top_artists_data or {'items': []})
+
+        # 2. Tous les appels suivants sont indépendants : ils partent en parallèle
+        calls, sources = recommendation_calls(top_artists_data or {'items': []}, recent_tracks_formatted,
+                                              top_artists, top_genres, market, min_popularity, max_popularity)
+        similar_tracks = collect_tracks(spotify_fan_out.run(bind_calls(sp, calls)), sources, recent_track_ids)
+
+        return jsonify(format_recommendations(similar_tracks, limit, recent_tracks_formatted, top_artists, top_genres))
         
     except Exception as e:
         print(f"Error generating recommendations: {e}")
@@ -510,18 +658,21 @@ def get_recommendations():
 
 @app.route('/get_playlist_suggestions', methods=['POST'])
 def get_playlist_suggestions():
-    sp = get_spotify_client()
+    sp = get_spotify_client(PRIORITY_BACKGROUND)
     if not sp:
         return jsonify({'error': 'User not authenticated'}), 401
 
     try:
         playlist_id = request.json['playlist_id']
         playlist = sp.playlist(playlist_id)
-        tracks = playlist['tracks']['items']
+        # Pistes suivantes récupérées en parallèle à partir de la première page
+        tracks = fetch_all_pages(
+            spotify_fan_out,
+            playlist['tracks'],
+            lambda offset, limit: sp.playlist_tracks(playlist_id, offset=offset, limit=limit),
+            "les pistes de la playlist"
+        )
         all_tracks = []
-        while playlist['tracks']['next']:
-            playlist = sp.next(playlist['tracks'])
-            tracks.extend(playlist['items'])
 
         for item in tracks:
             track = item['track']
@@ -534,16 +685,9 @@ def get_playlist_suggestions():
                 'external_url': track['external_urls']['spotify']
             })
 
-        # Créer une matrice de features pour les chansons
-        features = []
-        for track in all_tracks:
-            if track['preview_url']:
-                features.append(sp.audio_features(track['id'])[0])
-
-        feature_names = ['danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness',
-                         'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo']
-        X = np.array([[track[feature] for feature in feature_names] for track in features])
-        print(features)
+        # Créer une matrice de features pour les chansons (une ligne par piste dont les caractéristiques sont connues)
+        X, feature_track_ids = audio_feature_service.matrix(sp, [track['id'] for track in all_tracks])
+        print(f"Caractéristiques audio : {len(feature_track_ids)}/{len(all_tracks)} pistes")
 
         return jsonify({'message': 'ok'})
 
@@ -552,9 +696,27 @@ def get_playlist_suggestions():
         print(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+def format_artist(artist):
+    return {
+        'id': artist['id'],
+        'name': artist['name'],
+        'image': artist['images'][0]['url'] if artist['images'] else None
+    }
+
+def search_error(e):
+    """Réponse d'erreur de /search_artists (le Retry-After est transmis au client en cas de 429)"""
+    if e.http_status == 429:  # Too Many Requests
+        retry_after = e.headers.get('Retry-After', 30)
+        return {
+            'error': 'Rate limit exceeded',
+            'retry_after': retry_after
+        }, 429
+    print(f"Error searching artists: {e}")
+    return {'error': str(e)}, e.http_status
+
 @app.route('/search_artists', methods=['GET'])
 def search_artists():
-    sp = get_spotify_client()
+    sp = get_spotify_client(PRIORITY_SEARCH)
     if not sp:
         return jsonify({'error': 'User not authenticated'}), 401
 
@@ -564,21 +726,10 @@ def search_artists():
 
     try:
         results = sp.search(q=query, type='artist', limit=10)
-        artists = [{
-            'id': artist['id'],
-            'name': artist['name'],
-            'image': artist['images'][0]['url'] if artist['images'] else None
-        } for artist in results['artists']['items']]
-        return jsonify({'artists': artists})
+        return jsonify({'artists': [format_artist(artist) for artist in results['artists']['items']]})
     except SpotifyException as e:
-        if e.http_status == 429:  # Too Many Requests
-            retry_after = e.headers.get('Retry-After', 30)
-            return jsonify({
-                'error': 'Rate limit exceeded',
-                'retry_after': retry_after
-            }), 429
-        print(f"Error searching artists: {e}")
-        return jsonify({'error': str(e)}), e.http_status
+        payload, status = search_error(e)
+        return jsonify(payload), status
 
 @app.route('/get_artists_details', methods=['GET'])
 def get_artists_details():
@@ -598,20 +749,25 @@ def get_artists_details():
             results = sp.artists(batch)
             for artist in results['artists']:
                 if artist:
-                    artists_details.append({
-                        'id': artist['id'],
-                        'name': artist['name'],
-                        'image': artist['images'][0]['url'] if artist['images'] else None
-                    })
+                    artists_details.append(format_artist(artist))
         
         return jsonify({'artists': artists_details})
     except Exception as e:
         print(f"Error fetching artist details: {e}")
         return jsonify({'error': str(e)}), 500
 
+def format_search_track(track):
+    return {
+        'id': track['id'],
+        'name': track['name'],
+        'artists': [artist['name'] for artist in track['artists']],
+        'album': track['album']['name'],
+        'image': track['album']['images'][0]['url'] if track['album']['images'] else None
+    }
+
 @app.route('/search_tracks', methods=['GET'])
 def search_tracks():
-    sp = get_spotify_client()
+    sp = get_spotify_client(PRIORITY_SEARCH)
     if not sp:
         return jsonify({'error': 'User not authenticated'}), 401
 
@@ -621,14 +777,7 @@ def search_tracks():
 
     try:
         results = sp.search(q=query, type='track', limit=10)
-        tracks = [{
-            'id': track['id'],
-            'name': track['name'],
-            'artists': [artist['name'] for artist in track['artists']],
-            'album': track['album']['name'],
-            'image': track['album']['images'][0]['url'] if track['album']['images'] else None
-        } for track in results['tracks']['items']]
-        return jsonify({'tracks': tracks})
+        return jsonify({'tracks': [format_search_track(track) for track in results['tracks']['items']]})
     except Exception as e:
         print(f"Error searching tracks: {e}")
         return jsonify({'error': str(e)}), 500
@@ -640,34 +789,81 @@ def get_genres():
         return jsonify({'error': 'User not authenticated'}), 401
 
     try:
-        genres = [
-            "acoustic", "afrobeat", "alt-rock", "alternative", "ambient", "anime", "black-metal",
-            "bluegrass", "blues", "bossanova", "brazil", "breakbeat", "british",
-            "cantopop", "chicago-house", "children", "chill", "classical", "club",
-            "comedy", "country", "dance", "dancehall", "death-metal", "deep-house",
-            "detroit-techno", "disco", "disney", "drum-and-bass", "dub", "dubstep",
-            "edm", "electro", "electronic", "emo", "folk", "forro", "french",
-            "funk", "garage", "german", "gospel", "goth", "grindcore", "groove",
-            "grunge", "guitar", "happy", "hard-rock", "hardcore", "hardstyle",
-            "heavy-metal", "hip-hop", "holidays", "honky-tonk", "house", "idm",
-            "indian", "indie", "indie-pop", "industrial", "iranian", "j-dance",
-            "j-idol", "j-pop", "j-rock", "jazz", "k-pop", "kids", "latin",
-            "latino", "malay", "mandopop", "metal", "metal-misc", "metalcore",
-            "minimal-techno", "movies", "mpb", "new-age", "new-release", "opera",
-            "pagode", "party", "philippines-opm", "piano", "pop", "pop-film",
-            "post-dubstep", "power-pop", "progressive-house", "psych-rock",
-            "punk", "punk-rock", "r-n-b", "rainy-day", "reggae", "reggaeton",
-            "road-trip", "rock", "rock-n-roll", "rockabilly", "romance", "sad",
-            "salsa", "samba", "sertanejo", "show-tunes", "singer-songwriter",
-            "ska", "sleep", "songwriter", "soul", "soundtracks", "spanish",
-            "study", "summer", "swedish", "synth-pop", "tango", "techno",
-            "trance", "trip-hop", "turkish", "work-out", "world-music"
-        ]
-        return jsonify({'genres': sorted(genres)})  # Trier par ordre alphabétique
+        # Genres du tableau des centroïdes : ce sont ceux que /get_custom_recommendations sait traiter localement
+        return jsonify({'genres': sorted(genre_centroids.names)})  # Trier par ordre alphabétique
     except Exception as e:
         print(f"Error fetching genres: {e}")
         return jsonify({'error': str(e)}), 500
 
+def custom_recommendation_calls(seed_artists, seed_tracks, seed_genres, market, min_popularity, max_popularity):
+    """Appels Spotify de /get_custom_recommendations, un ou plusieurs par type de seed"""
+    calls, sources = [], []
+    
+    # Obtenir des recommandations basées sur les artistes sélectionnés
+    for artist_id in seed_artists:
+        calls.append(call(f"les tracks de l'artiste {artist_id}", 'artist_top_tracks', artist_id, country=market))
+        sources.append((10, "Top tracks de l'artiste sélectionné"))
+
+    # Obtenir des recommandations basées sur les morceaux sélectionnés
+    if seed_tracks:
+        # Faire une seule requête avec tous les seed_tracks
+        calls.append(call(
+            "les similaires des tracks",
+            'recommendations',
+            seed_tracks=seed_tracks,
+            limit=min(10 * len(seed_tracks), 20),  # Limiter le nombre total
+            market=market,
+            min_popularity=min_popularity,
+            max_popularity=max_popularity
+        ))
+        sources.append((20, "Similaire aux morceaux sélectionnés"))
+
+    # Obtenir des recommandations basées sur les genres (absents du tableau des centroïdes)
+    if seed_genres:
+        # Utiliser tous les genres sélectionnés en une seule requête
+        calls.append(call(
+            "la recherche par genres",
+            'recommendations',
+            seed_genres=seed_genres,
+            limit=min(10 * len(seed_genres), 20),  # Limiter le nombre total
+            market=market,
+            min_popularity=min_popularity,
+            max_popularity=max_popularity
+        ))
+        sources.append((20, "Basé sur les genres sélectionnés"))
+    return calls, sources
+
+def genre_tracks(seed_genres, min_popularity, max_popularity):
+    """
+    Pistes du dataset les plus proches des genres demandés (centroïdes de data_by_genres.csv),
+    calculées localement, sans appel à Spotify : d'abord celles de la fourchette de popularité,
+    complétées au besoin par les autres. Renvoie (pistes avec leur source, genres inconnus du tableau)
+    """
+    query, unknown = genre_centroids.query_vector(seed_genres)
+    if query is None:
+        return [], unknown
+    count = min(10 * len(seed_genres), 20)  # Limiter le nombre total
+    rows, _ = nn_index.search(query, min(10 * count, len(dataset)))
+    popularity = dataset.frame['popularity'].to_numpy()[rows]
+    in_range = (popularity >= min_popularity) & (popularity <= max_popularity)
+    rows = np.concatenate([rows[in_range], rows[~in_range]])[:count]
+    return [{
+        'track': track,
+        'source': "Basé sur les genres sélectionnés"
+    } for track in spotify_track_records(dataset, rows)], unknown
+
+def format_custom_recommendations(similar_tracks, seed_artists, seed_tracks, seed_genres):
+    # Mélanger et formater la réponse
+    random.shuffle(similar_tracks)
+    return {
+        'tracks': [item['track'] for item in similar_tracks[:80]],  # Limiter à 80 pistes
+        'based_on': {
+            'selected_artists': seed_artists,
+            'selected_tracks': seed_tracks,
+            'selected_genres': seed_genres
+        }
+    }
+
 @app.route('/get_custom_recommendations', methods=['POST'])
 def get_custom_recommendations():
     sp = get_spotify_client()
@@ -677,8 +873,7 @@ def get_custom_recommendations():
     try:
         data = request.json
         target_popularity = int(data.get('target_popularity', 50))
-        min_popularity = max(0, target_popularity - 10)
-        max_popularity = min(100, target_popularity + 10)
+        min_popularity, max_popularity = popularity_range(target_popularity)
 
         seed_artists = data.get('artists', [])[:5]
         seed_tracks = data.get('tracks', [])[:5]
@@ -689,78 +884,23 @@ def get_custom_recommendations():
         if not (seed_artists or seed_tracks or seed_genres):
             return jsonify({'error': 'At least one seed (artist, track, or genre) is required'}), 400
 
-        # Récupérer le pays de l'utilisateur
-        user_info = sp.current_user()
-        market = user_info['country']
+        # Genres calculés localement ; seuls les genres inconnus du tableau sont demandés à Spotify
+        similar_tracks, unknown_genres = genre_tracks(seed_genres, min_popularity, max_popularity)
 
-        similar_tracks = []
-        
-        # Obtenir des recommandations basées sur les artistes sélectionnés
-        if seed_artists:
-            try:
-                for artist_id in seed_artists:
-                    top_tracks = sp.artist_top_tracks(artist_id, country=market)['tracks']
-                    for track in top_tracks[:10]:
-                        similar_tracks.append({
-                            'track': track,
-                            'source': f"Top tracks de l'artiste sélectionné"
-                        })
-            except Exception as e:
-                print(f"Erreur lors de la récupération des tracks pour les artistes: {e}")
-
-        # Obtenir des recommandations basées sur les morceaux sélectionnés
-        if seed_tracks:
-            try:
-                # Faire une seule requête avec tous les seed_tracks
-                results = sp.recommendations(
-                    seed_tracks=seed_tracks,
-                    limit=min(10 * len(seed_tracks), 20),  # Limiter le nombre total
-                    market=market,
-                    min_popularity=min_popularity,
-                    max_popularity=max_popularity
-                )
-                for track in results['tracks']:
-                    similar_tracks.append({
-                        'track': track,
-                        'source': f"Similaire aux morceaux sélectionnés"
-                    })
-            except Exception as e:
-                print(f"Erreur lors de la recherche de similaires pour les tracks: {e}")
-
-        # Obtenir des recommandations basées sur les genres
-        if seed_genres:
-            try:
-                # Utiliser tous les genres sélectionnés en une seule requête
-                results = sp.recommendations(
-                    seed_genres=seed_genres,
-                    limit=min(10 * len(seed_genres), 20),  # Limiter le nombre total
-                    market=market,
-                    min_popularity=min_popularity,
-                    max_popularity=max_popularity
-                )
-                for track in results['tracks']:
-                    similar_tracks.append({
-                        'track': track,
-                        'source': f"Basé sur les genres sélectionnés"
-                    })
-            except Exception as e:
-                print(f"Erreur lors de la recherche par genres: {e}")
+        if seed_artists or seed_tracks or unknown_genres:
+            # Récupérer le pays de l'utilisateur (mis en cache dans la session)
+            market = get_user_market(sp)
+
+            # Tous les seeds sont récupérés en parallèle, avec un budget de temps commun :
+            # un seed en erreur ou trop lent est ignoré, les autres sont gardés
+            calls, sources = custom_recommendation_calls(seed_artists, seed_tracks, unknown_genres, market,
+                                                         min_popularity, max_popularity)
+            similar_tracks += collect_tracks(spotify_fan_out.run(bind_calls(sp, calls)), sources)
 
         if not similar_tracks:
             return jsonify({'error': 'Could not generate recommendations with the given seeds'}), 400
 
-        # Mélanger et formater la réponse
-        random.shuffle(similar_tracks)
-        formatted_response = {
-            'tracks': [item['track'] for item in similar_tracks[:80]],  # Limiter à 80 pistes
-            'based_on': {
-                'selected_artists': seed_artists,
-                'selected_tracks': seed_tracks,
-                'selected_genres': seed_genres
-            }
-        }
-
-        return jsonify(formatted_response)
+        return jsonify(format_custom_recommendations(similar_tracks, seed_artists, seed_tracks, seed_genres))
 
     except Exception as e:
         print(f"Error generating custom recommendations: {e}")
@@ -774,8 +914,9 @@ def get_dataset_recommendations():
         if not input_songs:
             return jsonify({'error': 'No input songs provided'}), 400
 
-        recommendations, input_songs_data = recommend_songs(input_songs, data)
-        return jsonify({
+        recommendations, input_songs_data = recommend_songs(input_songs, dataset, features, nn_index,
+                                                              knn_graph=knn_graph, cache=recommendation_cache)
+        return json_response({
             'recommendations': recommendations,
             'based_on': {
                 'input_songs': input_songs_data
@@ -787,34 +928,45 @@ def get_dataset_recommendations():
         print(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+@app.route('/get_dataset_recommendations_batch', methods=['POST'])
+def get_dataset_recommendations_batch():
+    try:
+        song_lists = request.json.get('song_lists', [])
+        n_songs = request.json.get('n_songs', 9)
+        if not song_lists:
+            return jsonify({'error': 'No song lists provided'}), 400
+        if len(song_lists) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'Too many song lists (max {MAX_BATCH_SIZE})'}), 400
+        # Les recommandations aléatoires (aucune chanson trouvée) sont tirées sans remise dans le dataset
+        max_songs = min(MAX_N_SONGS, len(dataset))
+        if isinstance(n_songs, bool) or not isinstance(n_songs, int) or not 1 <= n_songs <= max_songs:
+            return jsonify({'error': f'n_songs must be an integer between 1 and {max_songs}'}), 400
+
+        results = recommend_songs_batch(song_lists, dataset, features, nn_index, n_songs, knn_graph,
+                                        recommendation_cache)
+        return json_response({
+            'results': [{
+                'recommendations': recommendations,
+                'based_on': {
+                    'input_songs': input_songs_data
+                }
+            } for recommendations, input_songs_data in results]
+        })
+
+    except Exception as e:
+        print(f"Error generating batch dataset recommendations: {e}")
+        print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/search_dataset_tracks', methods=['GET'])
 def search_dataset_tracks():
     query = request.args.get('query', '').lower()
     if not query or len(query.strip()) == 0:
         return jsonify({'error': 'Query empty'}), 400
 
-    # Rechercher dans le dataset
-    # Convertir la colonne artists de string à liste si ce n'est pas déjà fait
-    if isinstance(data.iloc[0]['artists'], str):
-        data['artists'] = data['artists'].apply(ast.literal_eval)
-
-    # Filtrer les chansons qui correspondent à la recherche
-    mask = data['name'].str.lower().str.contains(query) | \
-           data['artists'].apply(lambda x: any(query in artist.lower() for artist in x))
-    
-    results = data[mask].head(10)  # Limiter à 10 résultats
-    
-    # Formater les résultats
-    tracks = []
-    for _, track in results.iterrows():
-        tracks.append({
-            'id': track['id'],  # Utiliser l'ID du dataset
-            'name': track['name'],
-            'artists': track['artists'],
-            'year': int(track['year'])
-        })
-    
-    return jsonify({'tracks': tracks})
+    # Rechercher dans l'index du dataset (titres et artistes)
+    rows = search_index.search(query, limit=10)  # Limiter à 10 résultats
+    return json_response({'tracks': song_records(dataset, rows, TRACK_FIELDS)})
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    app.run(debug=True, port=5000, threaded=True)
@@ -0,0 +1,394 @@
+"""
+Mode de service asynchrone (ASGI) du backend, à lancer depuis le dossier backend :
+
+    uvicorn asgi:app --port 5000
+
+Les routes qui attendent surtout l'API Spotify (recommandations, playlists, recherches) sont servies
+par des handlers asynchrones (aiohttp) : un seul processus peut attendre des centaines d'appels lents
+sans bloquer un thread par requête. Toutes les autres routes sont servies par l'application Flask
+(app.py), exécutée dans un pool de threads.
+La logique métier (appels à faire, formatage des réponses) est partagée avec app.py.
+"""
+import asyncio
+import json
+import os
+import time
+from urllib.parse import parse_qs
+import aiohttp
+import msgspec
+from asgiref.wsgi import WsgiToAsgi
+from spotipy.exceptions import SpotifyException
+import app as backend
+from rate_limit import PRIORITY_DEFAULT, PRIORITY_SEARCH, retry_after_seconds
+from spotify_cache import SPOTIFY_CACHE_TTLS, MemoryCache, cache_key, user_cache_key
+
+SPOTIFY_API_URL = backend.SPOTIFY_API_URL or 'https://api.spotify.com/v1/'
+
+
+async def run_cache(method, *args):
+    """
+    Appel au cache Spotify : direct pour le cache en mémoire (instantané), dans un thread pour Redis,
+    dont le client bloquant gèlerait la boucle d'événements le temps de l'aller-retour réseau
+    """
+    if isinstance(backend.spotify_cache, MemoryCache):
+        return method(*args)
+    return await asyncio.to_thread(method, *args)
+
+
+class AsyncSpotify:
+    """
+    Sous-ensemble asynchrone du client spotipy (mêmes noms de méthodes et mêmes paramètres),
+    sur une session aiohttp partagée : mêmes cache, limiteur de débit et gestion des 429 que le mode synchrone
+    """
+
+    def __init__(self, http, token_info, priority=PRIORITY_DEFAULT, throttle_retries=2):
+        self._http = http
+        self._headers = {'Authorization': f"Bearer {token_info['access_token']}"}
+        self._user_key = user_cache_key(token_info)
+        self.priority = priority
+        self.throttle_retries = throttle_retries
+
+    async def _get(self, name, path, **params):
+        params = {key: str(value) for key, value in params.items() if value is not None}
+        cache = backend.spotify_cache
+        key = None
+        if cache is not None and name in SPOTIFY_CACHE_TTLS:
+            scope, ttl = SPOTIFY_CACHE_TTLS[name]
+            key = cache_key(self._user_key, name, scope, (path,), params)
+            value = await run_cache(cache.get, key)
+            backend.spotify_cache_stats.record(name, hit=value is not None)
+            if value is not None:
+                return msgspec.json.decode(value)
+        result = await self._request(path, params)
+        if key is not None and result is not None:
+            await run_cache(cache.set, key, msgspec.json.encode(result), ttl)
+        return result
+
+    async def _request(self, path, params):
+        limiter = backend.spotify_limiter
+        for attempt in range(self.throttle_retries + 1):
+            deadline = time.monotonic() + limiter.max_wait
+            while (delay := limiter.reserve(self.priority)) > 0:
+                if time.monotonic() + delay > deadline:
+                    raise SpotifyException(429, -1, 'Rate limited (local limiter)',
+                                           headers={'Retry-After': str(int(delay) + 1)})
+                await asyncio.sleep(delay)
+            async with self._http.get(SPOTIFY_API_URL + path, params=params, headers=self._headers) as response:
+                if response.status == 429 and attempt < self.throttle_retries:
+                    error = SpotifyException(429, -1, path, headers=response.headers)
+                    limiter.throttled(retry_after_seconds(error))
+                    continue
+                if response.status >= 400:
+                    try:
+                        message = (await response.json(content_type=None)).get('error', {}).get('message')
+                    except ValueError:
+                        message = await response.text() or None
+                    raise SpotifyException(response.status, -1, f"{response.url}:\n {message}",
+                                           headers=response.headers)
+                return await response.json(content_type=None)
+
+    async def current_user(self):
+        return await self._get('current_user', 'me/')
+
+    async def current_user_recently_played(self, limit=50):
+        return await self._get('current_user_recently_played', 'me/player/recently-played', limit=limit)
+
+    async def current_user_top_artists(self, limit=20, offset=0, time_range='medium_term'):
+        return await self._get('current_user_top_artists', 'me/top/artists',
+                               time_range=time_range, limit=limit, offset=offset)
+
+    async def current_user_playlists(self, limit=50, offset=0):
+        return await self._get('current_user_playlists', 'me/playlists', limit=limit, offset=offset)
+
+    async def artist_top_tracks(self, artist_id, country='US'):
+        return await self._get('artist_top_tracks', f'artists/{artist_id}/top-tracks', country=country)
+
+    async def recommendations(self, seed_artists=None, seed_genres=None, seed_tracks=None, limit=20, market=None,
+                              **kwargs):
+        params = dict(limit=limit, market=market, **kwargs)
+        for name, seeds in (('seed_artists', seed_artists), ('seed_genres', seed_genres),
+                            ('seed_tracks', seed_tracks)):
+            if seeds:
+                params[name] = ','.join(seeds)
+        return await self._get('recommendations', 'recommendations', **params)
+
+    async def playlist(self, playlist_id, fields=None):
+        return await self._get('playlist', f'playlists/{playlist_id}', fields=fields, additional_types='track')
+
+    async def playlist_tracks(self, playlist_id, fields=None, limit=100, offset=0):
+        return await self._get('playlist_tracks', f'playlists/{playlist_id}/tracks', fields=fields,
+                               limit=limit, offset=offset, additional_types='track')
+
+    async def search(self, q, limit=10, offset=0, type='track'):
+        return await self._get('search', 'search', q=q, limit=limit, offset=offset, type=type)
+
+
+async def gather_calls(calls, timeout=None):
+    """
+    Équivalent asynchrone de FanOut.run : appels (description, coroutine, args, kwargs) lancés ensemble,
+    None pour chaque appel en erreur ou non terminé dans le budget de temps
+    """
+    timeout = timeout if timeout is not None else backend.spotify_fan_out.timeout
+
+    async def run(description, function, args, kwargs):
+        try:
+            return await function(*args, **kwargs)
+        except Exception as e:
+            print(f"Erreur pour {description}: {e}")
+            return None
+
+    tasks = [asyncio.ensure_future(run(*call)) for call in calls]
+    if tasks:
+        await asyncio.wait(tasks, timeout=timeout)
+    results = []
+    for (description, _, _, _), task in zip(calls, tasks):
+        if task.done():
+            results.append(task.result())
+        else:
+            task.cancel()
+            print(f"Délai dépassé pour {description}")
+            results.append(None)
+    return results
+
+
+async def fetch_all_pages(first_page, fetch_page, description='la page'):
+    """Équivalent asynchrone de concurrency.fetch_all_pages"""
+    items = list(first_page['items'])
+    if not first_page.get('next'):
+        return items
+    limit = first_page['limit'] or len(items)
+    offsets = range(first_page['offset'] + limit, first_page['total'], limit)
+    pages = await gather_calls([(f"{description} (offset {offset})", fetch_page, (offset, limit), {})
+                                for offset in offsets])
+    for offset, page in zip(offsets, pages):
+        if page is None:
+            page = await fetch_page(offset, limit)
+        items.extend(page['items'])
+    return items
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        self.args = {key: values[0] for key, values in parse_qs(scope['query_string'].decode('utf-8')).items()}
+        self.body = body
+
+    @property
+    def json(self):
+        return json.loads(self.body or b'{}')
+
+
+def in_session(request, function):
+    """
+    Exécute function dans un contexte de requête Flask (session Flask-Session de l'utilisateur),
+    et enregistre la session si elle a été modifiée. Bloquant : à appeler via asyncio.to_thread.
+    """
+    headers = {'Cookie': request.headers['cookie']} if 'cookie' in request.headers else {}
+    with backend.app.test_request_context(headers=headers):
+        result = function()
+        if backend.session.modified:
+            backend.app.session_interface.save_session(backend.app, backend.session, backend.app.response_class())
+        return result
+
+
+async def get_spotify_client(request, priority=PRIORITY_DEFAULT):
+    """Client asynchrone de l'utilisateur, et le pays gardé en session (None s'il n'est pas connu)"""
+    token_info, market = await asyncio.to_thread(
+        in_session, request, lambda: (backend.get_token_info(), backend.session.get('market')))
+    if not token_info:
+        return None, None
+    return AsyncSpotify(http_client(), token_info, priority), market
+
+
+async def remember_market(request, market):
+    def store():
+        backend.session['market'] = market
+    await asyncio.to_thread(in_session, request, store)
+
+
+async def get_recommendations(request):
+    sp, market = await get_spotify_client(request)
+    if not sp:
+        return {'error': 'User not authenticated'}, 401
+
+    target_popularity = int(request.args.get('target_popularity', 50))
+    limit = int(request.args.get('limit', 10))
+    min_popularity, max_popularity = backend.popularity_range(target_popularity)
+
+    recent_tracks, top_artists_data, *user_info = await gather_calls(
+        backend.bind_calls(sp, backend.listening_calls(market)))
+    if recent_tracks is None and top_artists_data is None:
+        return {'error': 'Spotify API unavailable'}, 502
+    if user_info and user_info[0]:
+        market = user_info[0]['country']
+        await remember_market(request, market)
+    recent_tracks_formatted, recent_track_ids, top_artists, top_genres = backend.summarize_listening(
+        recent_tracks or {'items': []}, top_artists_data or {'items': []})
+
+    calls, sources = backend.recommendation_calls(top_artists_data or {'items': []}, recent_tracks_formatted,
+                                                  top_artists, top_genres, market, min_popularity, max_popularity)
+    similar_tracks = backend.collect_tracks(await gather_calls(backend.bind_calls(sp, calls)), sources,
+                                            recent_track_ids)
+    return backend.format_recommendations(similar_tracks, limit, recent_tracks_formatted, top_artists, top_genres), 200
+
+
+async def get_custom_recommendations(request):
+    sp, market = await get_spotify_client(request)
+    if not sp:
+        return {'error': 'User not authenticated'}, 401
+
+    data = request.json
+    min_popularity, max_popularity = backend.popularity_range(int(data.get('target_popularity', 50)))
+    seed_artists = data.get('artists', [])[:5]
+    seed_tracks = data.get('tracks', [])[:5]
+    seed_genres = data.get('genres', [])[:3]
+    if not (seed_artists or seed_tracks or seed_genres):
+        return {'error': 'At least one seed (artist, track, or genre) is required'}, 400
+
+    # Recherche de plus proches voisins (calcul, éventuellement Pool.map) hors de la boucle d'événements
+    similar_tracks, unknown_genres = await asyncio.to_thread(backend.genre_tracks, seed_genres,
+                                                             min_popularity, max_popularity)
+    if seed_artists or seed_tracks or unknown_genres:
+        if market is None:
+            market = (await sp.current_user())['country']
+            await remember_market(request, market)
+
+        calls, sources = backend.custom_recommendation_calls(seed_artists, seed_tracks, unknown_genres, market,
+                                                             min_popularity, max_popularity)
+        similar_tracks += backend.collect_tracks(await gather_calls(backend.bind_calls(sp, calls)), sources)
+    if not similar_tracks:
+        return {'error': 'Could not generate recommendations with the given seeds'}, 400
+    return backend.format_custom_recommendations(similar_tracks, seed_artists, seed_tracks, seed_genres), 200
+
+
+async def get_playlists(request):
+    sp, _ = await get_spotify_client(request)
+    if not sp:
+        return {'error': 'User not authenticated'}, 401
+
+    items = await fetch_all_pages(
+        await sp.current_user_playlists(limit=50),
+        lambda offset, limit: sp.current_user_playlists(limit=limit, offset=offset),
+        "les playlists"
+    )
+    return [backend.format_playlist(item) for item in items], 200
+
+
+async def get_playlist_details(request):
+    sp, _ = await get_spotify_client(request)
+    if not sp:
+        return {'error': 'User not authenticated'}, 401
+
+    playlist_id = request.args.get('playlist_id')
+    if not playlist_id:
+        return {'error': 'Missing playlist_id'}, 400
+    page = int(request.args.get('page', 1))
+    per_page = int(request.args.get('per_page', 50))
+
+    # Informations de la playlist et page demandée en parallèle
+    playlist, tracks_page = await asyncio.gather(
+        sp.playlist(playlist_id, fields='name,tracks.total'),
+        sp.playlist_tracks(playlist_id, offset=(page - 1) * per_page, limit=per_page,
+                           fields=backend.PLAYLIST_TRACK_FIELDS)
+    )
+    return backend.format_playlist_details(playlist, tracks_page, page, per_page), 200
+
+
+async def search_artists(request):
+    sp, _ = await get_spotify_client(request, PRIORITY_SEARCH)
+    if not sp:
+        return {'error': 'User not authenticated'}, 401
+
+    query = request.args.get('query')
+    if not query or len(query.strip()) == 0:
+        return {'error': 'Query empty'}, 400
+    try:
+        results = await sp.search(q=query, type='artist', limit=10)
+    except SpotifyException as e:
+        return backend.search_error(e)
+    return {'artists': [backend.format_artist(artist) for artist in results['artists']['items']]}, 200
+
+
+async def search_tracks(request):
+    sp, _ = await get_spotify_client(request, PRIORITY_SEARCH)
+    if not sp:
+        return {'error': 'User not authenticated'}, 401
+
+    query = request.args.get('query')
+    if not query or len(query.strip()) == 0:
+        return {'error': 'Query empty'}, 400
+    results = await sp.search(q=query, type='track', limit=10)
+    return {'tracks': [backend.format_search_track(track) for track in results['tracks']['items']]}, 200
+
+
+ROUTES = {
+    ('GET', '/get_recommendations'): get_recommendations,
+    ('POST', '/get_custom_recommendations'): get_custom_recommendations,
+    ('GET', '/get_playlists'): get_playlists,
+    ('GET', '/get_playlist_details'): get_playlist_details,
+    ('GET', '/search_artists'): search_artists,
+    ('GET', '/search_tracks'): search_tracks,
+}
+
+_http = None
+
+
+def http_client():
+    """Session aiohttp partagée (connexions keep-alive), créée dans la boucle d'événements du serveur"""
+    global _http
+    if _http is None:
+        _http = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=backend.SPOTIFY_REQUESTS_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=int(os.getenv('UTA_ASYNC_MAX_CONNECTIONS', 200)))
+        )
+    return _http
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def send_json(send, payload, status, request):
+    headers = [(b'content-type', b'application/json')]
+    # Même politique CORS que flask_cors (supports_credentials) : l'origine est renvoyée telle quelle
+    origin = request.headers.get('origin')
+    if origin:
+        headers += [(b'access-control-allow-origin', origin.encode('latin-1')),
+                    (b'access-control-allow-credentials', b'true'), (b'vary', b'Origin')]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': backend.encode_json(payload)})
+
+
+flask_app = WsgiToAsgi(backend.app)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                http_client()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if _http is not None:
+                    await _http.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    handler = ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+    if handler is None:
+        return await flask_app(scope, receive, send)
+
+    request = Request(scope, await read_body(receive))
+    try:
+        payload, status = await handler(request)
+    except Exception as e:
+        print(f"Error in {scope['path']}: {e}")
+        payload, status = {'error': str(e)}, 500
+    await send_json(send, payload, status, request)
@@ -0,0 +1,71 @@
+import msgspec
+import numpy as np
+from concurrency import call
+
+# Caractéristiques audio renvoyées par Spotify et présentes dans data.csv
+AUDIO_FEATURE_NAMES = ['danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness',
+                       'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo']
+
+# L'API accepte au plus 100 ids par appel à audio_features
+AUDIO_FEATURES_CHUNK_SIZE = 100
+
+
+class AudioFeatureService:
+    """
+    Caractéristiques audio d'un ensemble de pistes, avec le moins d'appels possible à l'API :
+    1. pistes présentes dans le dataset : valeurs de data.csv, sans appel ;
+    2. pistes déjà demandées : cache par piste (les caractéristiques d'une piste ne changent pas) ;
+    3. pistes restantes : ids dédupliqués, demandés par lots de 100 en parallèle.
+    """
+
+    def __init__(self, dataset, cache=None, fan_out=None, ttl=30 * 86400, feature_names=AUDIO_FEATURE_NAMES):
+        self.dataset = dataset
+        self.cache = cache
+        self.fan_out = fan_out
+        self.ttl = ttl
+        self.feature_names = list(feature_names)
+        self._columns = {name: dataset.frame[name].to_numpy() for name in self.feature_names}
+
+    def get(self, sp, track_ids):
+        """Dictionnaire id -> caractéristiques ; les pistes inconnues de Spotify et du dataset sont absentes"""
+        track_ids = list(dict.fromkeys(track_id for track_id in track_ids if track_id))
+        found = {}
+        missing = []
+        for track_id in track_ids:
+            row = self.dataset.lookup.find({'id': track_id})
+            if row is not None:
+                found[track_id] = {name: self._columns[name][row].item() for name in self.feature_names}
+                continue
+            cached = self.cache.get(self._key(track_id)) if self.cache is not None else None
+            if cached is not None:
+                found[track_id] = msgspec.json.decode(cached)
+            else:
+                missing.append(track_id)
+
+        chunks = [missing[i:i + AUDIO_FEATURES_CHUNK_SIZE] for i in range(0, len(missing), AUDIO_FEATURES_CHUNK_SIZE)]
+        calls = [call(f"les caractéristiques audio ({len(chunk)} pistes)", sp.audio_features, chunk) for chunk in chunks]
+        results = self.fan_out.run(calls) if self.fan_out is not None else [sp.audio_features(chunk) for chunk in chunks]
+        for result in results:
+            for audio_features in result or []:
+                if not audio_features:
+                    continue
+                values = {name: audio_features[name] for name in self.feature_names}
+                found[audio_features['id']] = values
+                if self.cache is not None:
+                    self.cache.set(self._key(audio_features['id']), msgspec.json.encode(values), self.ttl)
+        return found
+
+    def matrix(self, sp, track_ids):
+        """
+        Matrice (n, len(feature_names)) des pistes dont les caractéristiques sont connues,
+        et la liste de leurs ids dans le même ordre
+        """
+        found = self.get(sp, track_ids)
+        ids = [track_id for track_id in dict.fromkeys(track_ids) if track_id in found]
+        X = np.array([[found[track_id][name] for name in self.feature_names] for track_id in ids],
+                     dtype=np.float64).reshape(len(ids), len(self.feature_names))
+        return X, ids
+
+    @staticmethod
+    def _key(track_id):
+        return f"global:audio_features_track:{track_id}"
@@ -0,0 +1,725 @@
+"""
+Benchmarks du backend, à lancer depuis le dossier backend :
+
+    python bench.py recall [--synthetic N] [--k 9] [--queries 200]
+    python bench.py years [--k 9] [--queries 200] [--seeds 5]
+    python bench.py knn [--k 9] [--queries 200] [--graph-k 50]
+    python bench.py memo [--requests 5000] [--distinct 2000] [--zipf 1.2]
+    python bench.py shards [--rows 1000000,10000000] [--workers 1,2,4,8] [--queries 50]
+    python bench.py search [--queries love,the,a,...]
+    python bench.py memory [--workers 4]
+    python bench.py batch [--synthetic N] [--batch-sizes 1,16,64,256]
+    python bench.py format [--sizes 9,100,1000]
+    python bench.py fanout [--latency 0.05] [--repeat 5]
+    python bench.py connections [--requests 200]
+    python bench.py pages [--playlist-size 2000]
+    python bench.py ratelimit [--api-rate 20] [--calls 200]
+    python bench.py serve [--concurrency 100,400] [--latency 1]
+    python bench.py sessions [--requests 2000]
+"""
+import argparse
+import json
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from dataset import CACHE_DIR, DATA_PATH, load_dataset
+from features import NUMBER_COLS, FeatureMatrix, load_or_build_features, normalize_rows
+from knn_graph import build_knn_graph
+from neighbors import BruteForceIndex, IVFIndex, ShardedIndex, YearIndex, build_index
+from recommendation_cache import RecommendationCache
+from search_index import TrackSearchIndex
+from serialization import SONG_FIELDS, encode_json, song_records
+
+
+def synthetic_matrix(n_rows, n_cols=len(NUMBER_COLS), n_clusters=200, seed=0):
+    """Catalogue synthétique : mélange de gaussiennes, plus réaliste qu'un bruit uniforme"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, n_cols)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, n_rows)
+    return centers[labels] + rng.normal(scale=0.5, size=(n_rows, n_cols)).astype(np.float32)
+
+
+def load_matrix(args):
+    """Matrice standardisée puis normalisée, comme FeatureMatrix.normalized"""
+    if args.synthetic:
+        return normalize_rows(synthetic_matrix(args.synthetic))
+    return FeatureMatrix.fit(pd.read_csv(args.data)).normalized
+
+
+def sample_queries(matrix, n_queries, seed=1):
+    """Requêtes réalistes : moyenne de 1 à 5 chansons du catalogue"""
+    rng = np.random.default_rng(seed)
+    return [matrix[rng.integers(0, len(matrix), rng.integers(1, 6))].mean(axis=0) for _ in range(n_queries)]
+
+
+def timed(fn, queries):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.array(latencies)
+
+
+def bench_recall(args):
+    matrix = load_matrix(args)
+    queries = sample_queries(matrix, args.queries)
+    print(f"{len(matrix)} chansons, {len(queries)} requêtes, k={args.k}")
+
+    exact = BruteForceIndex(matrix)
+    expected, latencies = timed(lambda q: set(exact.search(q, args.k)[0].tolist()), queries)
+    print(f"{'exact':>12}  recall=1.000  p50={np.median(latencies):.2f}ms  p95={np.percentile(latencies, 95):.2f}ms")
+
+    start = time.perf_counter()
+    ivf = IVFIndex(matrix, n_lists=args.n_lists)
+    print(f"IVF : {ivf.n_lists} listes construites en {time.perf_counter() - start:.1f}s")
+    for n_probe in (1, 2, 4, 8, 16, 32, 64):
+        if n_probe > ivf.n_lists:
+            break
+        found, latencies = timed(lambda q: set(ivf.search(q, args.k, n_probe=n_probe)[0].tolist()), queries)
+        recall = np.mean([len(f & e) / len(e) for f, e in zip(found, expected)])
+        print(f"{'nprobe=' + str(n_probe):>12}  recall={recall:.3f}  p50={np.median(latencies):.2f}ms  "
+              f"p95={np.percentile(latencies, 95):.2f}ms")
+
+
+def bench_years(args):
+    dataset = load_dataset(args.data)
+    features = FeatureMatrix.fit(dataset.frame)
+    years = dataset.frame['year'].to_numpy()
+
+    # Chansons d'entrée réalistes : quelques chansons d'années proches (même décennie environ)
+    rng = np.random.default_rng(1)
+    queries = []
+    for _ in range(args.queries):
+        first = rng.integers(0, len(dataset))
+        nearby = np.flatnonzero(np.abs(years - years[first]) <= args.spread)
+        rows = np.concatenate([[first], rng.choice(nearby, rng.integers(0, args.seeds), replace=False)])
+        excluded = np.concatenate([dataset.lookup.same_song(row) for row in rows])
+        queries.append((features.matrix[rows].mean(axis=0, dtype=np.float64), excluded))
+    print(f"{len(dataset)} chansons, {len(queries)} requêtes de 1 à {args.seeds} chansons "
+          f"(à {args.spread} ans près), k={args.k}")
+
+    exact = BruteForceIndex(features.normalized)
+    expected, latencies = timed(lambda q: set(exact.search(q[0], args.k, q[1])[0].tolist()), queries)
+    print(f"{'exact':>12}  recouvrement=1.000  p50={np.median(latencies):.2f}ms  "
+          f"p95={np.percentile(latencies, 95):.2f}ms")
+
+    start = time.perf_counter()
+    index = YearIndex.build(features, years)
+    print(f"Années : {index.n_lists} partitions construites en {time.perf_counter() - start:.2f}s")
+    for n_probe in (1, 2, 4, 8, 16, 32):
+        found, latencies = timed(lambda q: set(index.search(q[0], args.k, q[1], n_probe=n_probe)[0].tolist()),
+                                 queries)
+        overlap = np.mean([len(f & e) / len(e) for f, e in zip(found, expected)])
+        print(f"{'nprobe=' + str(n_probe):>12}  recouvrement={overlap:.3f}  p50={np.median(latencies):.2f}ms  "
+              f"p95={np.percentile(latencies, 95):.2f}ms")
+
+
+def bench_knn(args):
+    dataset = load_dataset(args.data)
+    features = FeatureMatrix.fit(dataset.frame, signature=dataset.signature)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        features.save(os.path.join(tmp_dir, 'features'))
+        features = FeatureMatrix.load(os.path.join(tmp_dir, 'features'))
+        start = time.perf_counter()
+        graph = build_knn_graph(os.path.join(tmp_dir, 'features'), os.path.join(tmp_dir, 'knn'),
+                                k=args.graph_k, progress=lambda message: None)
+        print(f"{len(dataset)} chansons, graphe {graph.k} voisins construit en {time.perf_counter() - start:.1f}s, "
+              f"k={args.k}")
+
+        exact = BruteForceIndex(features.normalized)
+        rng = np.random.default_rng(1)
+        cases = [
+            ('1 chanson', lambda first: [first]),
+            ('2 au hasard', lambda first: [first, rng.integers(0, len(dataset))]),
+            # Chansons d'entrée proches l'une de l'autre, le cas courant d'une sélection d'utilisateur
+            ('2 voisines', lambda first: [first, graph.neighbors[first][rng.integers(0, graph.k)]]),
+        ]
+        for label, pick in cases:
+            queries = []
+            for _ in range(args.queries):
+                rows = np.unique(pick(rng.integers(0, len(dataset))))
+                excluded = np.concatenate([dataset.lookup.same_song(row) for row in rows])
+                queries.append((rows, features.matrix[rows].mean(axis=0, dtype=np.float64), excluded))
+            expected, scan_latencies = timed(lambda q: exact.search(q[1], args.k, q[2])[0].tolist(), queries)
+
+            def graph_search(query):
+                found = graph.search(query[0], query[1], args.k, query[2])
+                return None if found is None else found[0].tolist()
+
+            found, graph_latencies = timed(graph_search, queries)
+            # Sans résultat garanti par le graphe, l'application fait la recherche complète
+            hits = [i for i, result in enumerate(found) if result is not None]
+            exact_hits = sum(found[i] == expected[i] for i in hits)
+            print(f"{label} : graphe suffisant {len(hits)}/{len(queries)} "
+                  f"(identiques à la recherche complète : {exact_hits}/{len(hits)})")
+            print(f"{'complète':>12}  p50={np.median(scan_latencies):.3f}ms  p95={np.percentile(scan_latencies, 95):.3f}ms")
+            print(f"{'graphe':>12}  p50={np.median(graph_latencies):.3f}ms  p95={np.percentile(graph_latencies, 95):.3f}ms")
+
+
+def bench_memo(args):
+    index = BruteForceIndex(load_matrix(args))
+    # Listes de chansons d'entrée de popularité très inégale (loi de Zipf), comme les requêtes des utilisateurs
+    rng = np.random.default_rng(1)
+    seed_lists = [rng.choice(len(index), rng.integers(1, 6), replace=False) for _ in range(args.distinct)]
+    requests = [seed_lists[(rank - 1) % args.distinct] for rank in rng.zipf(args.zipf, args.requests)]
+    print(f"{len(index)} chansons, {len(requests)} requêtes sur {len(set(map(tuple, requests)))} listes distinctes, k=9")
+
+    def compute(row_lists):
+        centers = np.stack([index.vectors[list(rows)].mean(axis=0) for rows in row_lists])
+        return [indices for indices, _ in index.search_batch(centers, 9, [np.asarray(rows) for rows in row_lists])]
+
+    _, latencies = timed(lambda rows: compute([rows])[0], requests)
+    print(f"{'sans cache':>12}  p50={np.median(latencies):.3f}ms  p95={np.percentile(latencies, 95):.3f}ms  "
+          f"total={np.sum(latencies):.0f}ms")
+    cache = RecommendationCache('bench')
+    _, latencies = timed(lambda rows: cache.get_many([cache.key(rows, 9)],
+                                                     lambda keys: compute([key[2] for key in keys]))[0], requests)
+    stats = cache.snapshot()
+    print(f"{'cache':>12}  p50={np.median(latencies):.3f}ms  p95={np.percentile(latencies, 95):.3f}ms  "
+          f"total={np.sum(latencies):.0f}ms  hits={stats['hits'] / len(requests):.0%}")
+
+
+def bench_shards(args):
+    print(f"{os.cpu_count()} cœur(s) disponible(s), k=9")
+    for n_rows in (int(rows) for rows in args.rows.split(',')):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Matrice synthétique écrite dans un cache, mappée par les processus comme celle de l'application
+            features_dir = os.path.join(tmp_dir, 'features')
+            matrix = synthetic_matrix(n_rows)
+            FeatureMatrix(matrix, np.zeros(matrix.shape[1]), np.ones(matrix.shape[1])).save(features_dir)
+            del matrix
+            features = FeatureMatrix.load(features_dir)
+            queries = sample_queries(features.matrix, args.queries)
+            batch = np.stack(sample_queries(features.matrix, args.batch_size, seed=2))
+            print(f"{n_rows} chansons ({features.normalized.nbytes / 1e6:.0f} Mo)")
+
+            def report(label, index):
+                _, latencies = timed(lambda query: index.search(query, 9), queries)
+                start = time.perf_counter()
+                index.search_batch(batch, 9)
+                throughput = len(batch) / (time.perf_counter() - start)
+                print(f"{label:>14}  p50={np.median(latencies):.1f}ms  p95={np.percentile(latencies, 95):.1f}ms  "
+                      f"lot de {len(batch)} : {throughput:.0f} requêtes/s")
+
+            report('1 processus', BruteForceIndex(features.normalized))
+            for workers in (int(workers) for workers in args.workers.split(',')):
+                index = ShardedIndex(features_dir, workers=workers)
+                try:
+                    # Première requête : démarrage des processus et lecture des pages de la matrice
+                    index.search(queries[0], 9)
+                    report(f'{workers} shard(s)', index)
+                finally:
+                    index.close()
+
+
+def bench_search(args):
+    dataset = load_dataset(args.data)
+    spotify_data = dataset.frame
+    artists = pd.Series([dataset.artists[row] for row in range(len(dataset))])
+    start = time.perf_counter()
+    index = TrackSearchIndex(spotify_data['name'], dataset.artists,
+                             spotify_data['popularity'] if 'popularity' in spotify_data else None)
+    print(f"{len(spotify_data)} chansons, index construit en {time.perf_counter() - start:.2f}s")
+
+    def scan(query):
+        # Ancienne implémentation : parcours complet des colonnes name et artists
+        mask = spotify_data['name'].str.lower().str.contains(query, regex=False) | \
+               artists.apply(lambda x: any(query in artist.lower() for artist in x))
+        return spotify_data[mask].head(10)
+
+    print(f"{'requête':>12}  {'scan':>10}  {'index':>10}")
+    for query in args.queries.split(','):
+        _, scan_latencies = timed(scan, [query] * args.repeat)
+        _, index_latencies = timed(index.search, [query] * args.repeat)
+        print(f"{query:>12}  {np.median(scan_latencies):>8.2f}ms  {np.median(index_latencies):>8.3f}ms")
+
+
+def bench_batch(args):
+    index = BruteForceIndex(load_matrix(args))
+    print(f"{len(index)} chansons, k={args.k}")
+    for batch_size in (int(size) for size in args.batch_sizes.split(',')):
+        queries = np.stack(sample_queries(index.vectors, batch_size))
+        start = time.perf_counter()
+        for query in queries:
+            index.search(query, args.k)
+        single = time.perf_counter() - start
+        start = time.perf_counter()
+        index.search_batch(queries, args.k)
+        batch = time.perf_counter() - start
+        print(f"K={batch_size:>5}  une par une : {batch_size / single:>8.0f} requêtes/s  "
+              f"en lot : {batch_size / batch:>8.0f} requêtes/s")
+
+
+def bench_format(args):
+    dataset = load_dataset(args.data)
+    rng = np.random.default_rng(0)
+
+    def iterrows_records(rows):
+        # Ancienne implémentation : iterrows() et conversion champ par champ
+        results = []
+        for row, song in dataset.frame.iloc[rows].iterrows():
+            record = {field: float(song[field]) for field in SONG_FIELDS if field not in ('name', 'year', 'artists')}
+            record.update(name=song['name'], year=int(song['year']), artists=dataset.artists[row])
+            results.append(record)
+        return results
+
+    print(f"{'n':>6}  {'iterrows':>10}  {'colonnes':>10}  {'+ json':>10}  {'+ msgspec':>10}   (µs par ligne)")
+    for size in (int(size) for size in args.sizes.split(',')):
+        batches = [rng.integers(0, len(dataset), size) for _ in range(args.repeat)]
+        per_row = lambda latencies: np.median(latencies) * 1000 / size
+        _, old = timed(iterrows_records, batches)
+        _, new = timed(lambda rows: song_records(dataset, rows), batches)
+        _, with_json = timed(lambda rows: json.dumps(song_records(dataset, rows)), batches)
+        _, with_msgspec = timed(lambda rows: encode_json(song_records(dataset, rows)), batches)
+        print(f"{size:>6}  {per_row(old):>10.1f}  {per_row(new):>10.2f}  {per_row(with_json):>10.2f}  "
+              f"{per_row(with_msgspec):>10.2f}")
+
+
+def memory_usage():
+    """Mémoire du processus en Mo (Linux) : Rss, Pss (pages partagées divisées entre processus), privée"""
+    usage = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                usage[key] = int(value.split()[0]) / 1024
+    return {'rss': usage['Rss'], 'pss': usage['Pss'], 'private': usage['Private_Clean'] + usage['Private_Dirty']}
+
+
+def memory_worker(mode, data_path, cache_dir, results, done):
+    before = memory_usage()
+    if mode == 'csv':
+        # Sans cache : CSV parsé et matrices calculées dans chaque worker (copies privées)
+        dataset = load_dataset(data_path)
+        features = FeatureMatrix.fit(dataset.frame)
+        index = BruteForceIndex(features.normalized)
+    else:
+        dataset = load_dataset(data_path, os.path.join(cache_dir, 'dataset'))
+        features = load_or_build_features(dataset.frame, os.path.join(cache_dir, 'features'), dataset.signature)
+        index = build_index('exact', features)
+    # Toucher toutes les pages, comme le fait une première requête de recommandation
+    index.search(features.matrix[0], 9)
+    after = memory_usage()
+    results.put({key: after[key] - before[key] for key in after})
+    done.wait()
+
+
+def bench_memory(args):
+    # Préparer les caches une fois avant de lancer les workers
+    dataset = load_dataset(args.data, os.path.join(args.cache_dir, 'dataset'))
+    load_or_build_features(dataset.frame, os.path.join(args.cache_dir, 'features'), dataset.signature)
+    print(f"{len(dataset)} chansons, {args.workers} workers")
+
+    context = multiprocessing.get_context('spawn')
+    for mode in ('csv', 'mmap'):
+        results, done = context.Queue(), context.Event()
+        workers = [context.Process(target=memory_worker, args=(mode, args.data, args.cache_dir, results, done))
+                   for _ in range(args.workers)]
+        for worker in workers:
+            worker.start()
+        # Mesurer pendant que tous les workers sont vivants, pour que Pss répartisse les pages partagées
+        usages = [results.get() for _ in workers]
+        done.set()
+        for worker in workers:
+            worker.join()
+        mean = {key: np.mean([usage[key] for usage in usages]) for key in usages[0]}
+        print(f"{mode:>6}  par worker : rss={mean['rss']:.1f}Mo  pss={mean['pss']:.1f}Mo  "
+              f"privée={mean['private']:.1f}Mo")
+
+
+def spotify_app(stub):
+    """
+    Importe l'application avec un client Spotify pointant vers le faux serveur local,
+    sans cache (chaque requête doit atteindre le serveur) ni limite de débit, et un client de test authentifié
+    """
+    for key in ('SPOTIPY_CLIENT_ID', 'SPOTIPY_CLIENT_SECRET'):
+        os.environ.setdefault(key, 'stub')
+    os.environ.setdefault('UTA_SPOTIFY_RATE', '1000000')
+    os.environ.setdefault('UTA_SPOTIFY_BURST', '1000000')
+    os.environ.setdefault('SPOTIPY_REDIRECT_URI', 'http://localhost:5000/callback')
+    if stub is not None:
+        os.environ['UTA_SPOTIFY_API_URL'] = stub.url
+    os.environ['UTA_SPOTIFY_CACHE'] = 'none'
+    import app as backend
+
+    client = backend.app.test_client()
+    with client.session_transaction() as session:
+        session['token_info'] = {'access_token': 'stub', 'refresh_token': 'stub',
+                                 'expires_at': int(time.time()) + 3600, 'scope': ''}
+    return backend, client
+
+
+def bench_fanout(args):
+    from concurrency import FanOut
+    from spotify_stub import SpotifyStub
+
+    stub = SpotifyStub(latency=args.latency).start()
+    backend, client = spotify_app(stub)
+    endpoints = {
+        'recommendations': lambda: client.get('/get_recommendations?limit=20'),
+        'custom': lambda: client.post('/get_custom_recommendations', json={
+            'artists': ['a1', 'a2', 'a3', 'a4', 'a5'], 'tracks': ['t1', 't2'], 'genres': ['pop', 'rock']}),
+    }
+    print(f"Latence simulée par appel Spotify : {args.latency * 1000:.0f}ms")
+    for name, send in endpoints.items():
+        for label, workers in (('séquentiel', 1), ('parallèle', backend.spotify_fan_out.max_workers)):
+            backend.spotify_fan_out = FanOut(max_workers=workers, timeout=60)
+            requests_before = stub.requests
+            responses, latencies = timed(lambda _: send(), range(args.repeat))
+            assert all(response.status_code == 200 for response in responses)
+            calls = (stub.requests - requests_before) / args.repeat
+            print(f"{name:>16}  {label:>10}  {calls:.0f} appels/requête  p50={np.median(latencies):.0f}ms  "
+                  f"max={np.max(latencies):.0f}ms")
+    stub.stop()
+
+
+def bench_connections(args):
+    import spotipy
+    from spotify_stub import SpotifyStub
+
+    stub = SpotifyStub(latency=args.latency).start()
+    backend, client = spotify_app(stub)
+    pooled = backend.PooledSpotify, backend.spotify_session
+
+    class PerRequestSpotify(spotipy.Spotify):
+        # Ancien comportement : un client spotipy, donc une session et de nouvelles connexions, par requête.
+        # Limiteur et priorité (ajoutés depuis) ignorés
+        def __init__(self, *args, limiter=None, priority=None, **kwargs):
+            super().__init__(*args, **kwargs)
+
+    modes = {'par requête': (PerRequestSpotify, True), 'partagée': pooled}
+    for label, (client_class, session) in modes.items():
+        backend.PooledSpotify, backend.spotify_session = client_class, session
+        connections_before, requests_before = stub.connections, stub.requests
+        _, latencies = timed(lambda _: client.get('/get_artists_details?ids=a1,a2'), range(args.requests))
+        connections = stub.connections - connections_before
+        requests = stub.requests - requests_before
+        print(f"{label:>12}  {1000 * connections / requests:>6.0f} connexions / 1000 appels  "
+              f"p50={np.median(latencies):.1f}ms")
+    backend.PooledSpotify, backend.spotify_session = pooled
+    print(f"Statistiques de la session partagée : {backend.connection_stats(backend.spotify_session)}")
+    stub.stop()
+
+
+def bench_pages(args):
+    from concurrency import FanOut, fetch_all_pages
+    from spotify_client import PooledSpotify, create_session
+    from spotify_stub import SpotifyStub
+
+    stub = SpotifyStub(latency=args.latency, playlist_size=args.playlist_size).start()
+    sp = PooledSpotify(auth='stub', requests_session=create_session())
+    sp.prefix = stub.url
+    fan_out = FanOut()
+
+    def sequential(_):
+        # Ancienne implémentation : pages suivies une à une via next
+        page = sp.playlist('p1')['tracks']
+        items = list(page['items'])
+        while page['next']:
+            page = sp.next(page)
+            items.extend(page['items'])
+        return items
+
+    def parallel(_):
+        first_page = sp.playlist('p1')['tracks']
+        return fetch_all_pages(fan_out, first_page,
+                               lambda offset, limit: sp.playlist_tracks('p1', offset=offset, limit=limit))
+
+    print(f"Playlist de {args.playlist_size} pistes, latence simulée {args.latency * 1000:.0f}ms par appel")
+    (expected, *_), sequential_latencies = timed(sequential, range(args.repeat))
+    (found, *_), parallel_latencies = timed(parallel, range(args.repeat))
+    assert [item['track']['id'] for item in found] == [item['track']['id'] for item in expected]
+    print(f"séquentiel : p50={np.median(sequential_latencies):.0f}ms  "
+          f"parallèle : p50={np.median(parallel_latencies):.0f}ms")
+    stub.stop()
+
+
+def bench_ratelimit(args):
+    import spotipy
+    from concurrency import FanOut, call
+    from rate_limit import PRIORITY_BACKGROUND, PRIORITY_SEARCH, RateLimiter
+    from spotify_client import PooledSpotify, create_session
+    from spotify_stub import SpotifyStub
+
+    print(f"Faux serveur limité à {args.api_rate} appels/s, {args.calls} appels d'enrichissement "
+          f"et {args.calls // 10} recherches lancés ensemble")
+    for label, limiter in (('sans limiteur', None),
+                           ('limiteur', RateLimiter(rate=args.api_rate, burst=args.api_rate, max_wait=60))):
+        stub = SpotifyStub(latency=args.latency, rate_limit=args.api_rate).start()
+        session = create_session()
+
+        def client(priority):
+            if limiter is None:
+                # Ancien comportement : session propre au client, chaque thread réessaie les 429 de son côté
+                sp = spotipy.Spotify(auth='stub')
+            else:
+                sp = PooledSpotify(auth='stub', requests_session=session, limiter=limiter, priority=priority,
+                                   throttle_retries=5)
+            sp.prefix = stub.url
+            return sp
+
+        background, search = client(PRIORITY_BACKGROUND), client(PRIORITY_SEARCH)
+        calls = [call('enrichissement', background.audio_features, [f't{i}']) for i in range(args.calls)]
+        calls += [call('recherche', search.search, f'q{i}', type='artist') for i in range(args.calls // 10)]
+        start = time.perf_counter()
+        results = FanOut(max_workers=64, timeout=120).run(calls)
+        elapsed = time.perf_counter() - start
+        failed = sum(result is None for result in results)
+        print(f"{label:>14}  {elapsed:>5.1f}s  échecs={failed}  429 reçus={stub.throttled}  "
+              f"stats={limiter.snapshot() if limiter else {}}")
+        stub.stop()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Le serveur ne répond pas sur le port {port}")
+
+
+async def load_test(url, cookie, concurrency, n_requests):
+    """n_requests requêtes GET, au plus concurrency en même temps : débit, latences, erreurs"""
+    import aiohttp
+
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession(headers={'Cookie': f'session={cookie}'},
+                                     connector=aiohttp.TCPConnector(limit=concurrency),
+                                     timeout=aiohttp.ClientTimeout(total=120)) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    async with client.get(url) as response:
+                        await response.read()
+                        errors += response.status != 200
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(n_requests)))
+        elapsed = time.perf_counter() - start
+    return n_requests / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 95), errors
+
+
+def bench_serve(args):
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    stub_port = free_port()
+    stub = subprocess.Popen([sys.executable, 'spotify_stub.py', '--port', str(stub_port), '--latency', str(args.latency)],
+                            cwd=backend_dir, stdout=subprocess.DEVNULL)
+    wait_for_port(stub_port)
+    env = dict(os.environ, UTA_SPOTIFY_API_URL=f'http://127.0.0.1:{stub_port}/v1/', UTA_SPOTIFY_CACHE='none',
+               UTA_SPOTIFY_RATE='1000000', UTA_SPOTIFY_BURST='1000000', UTA_SESSION_STORE='filesystem')
+    for key in ('SPOTIPY_CLIENT_ID', 'SPOTIPY_CLIENT_SECRET'):
+        env.setdefault(key, 'stub')
+    env.setdefault('SPOTIPY_REDIRECT_URI', 'http://localhost:5000/callback')
+    os.environ.update(env)
+
+    # Session partagée par les trois processus (stockage fichiers dans le dossier courant)
+    _, client = spotify_app(stub=None)
+    cookie = client.get_cookie('session').value
+
+    port = free_port()
+    servers = {
+        'sync (Flask, threads)': [sys.executable, '-c', f"import app; app.app.run(port={port}, threaded=True)"],
+        'async (uvicorn)': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning'],
+    }
+    print(f"Latence simulée par appel Spotify : {args.latency * 1000:.0f}ms, {args.requests} requêtes par mesure")
+    try:
+        for label, command in servers.items():
+            server = subprocess.Popen(command, cwd=backend_dir, env=env, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL)
+            try:
+                wait_for_port(port)
+                for endpoint in args.endpoints.split(','):
+                    for concurrency in (int(c) for c in args.concurrency.split(',')):
+                        rps, p50, p95, errors = asyncio.run(
+                            load_test(f'http://127.0.0.1:{port}{endpoint}', cookie, concurrency, args.requests))
+                        print(f"{label:>22}  {endpoint:>30}  c={concurrency:<4}  {rps:>7.1f} req/s  "
+                              f"p50={p50:.0f}ms  p95={p95:.0f}ms  erreurs={errors}")
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        stub.terminate()
+
+
+def bench_sessions(args):
+    from flask import Flask, request
+    from session_store import compact_token, configure_sessions
+
+    # Token tel que renvoyé par Spotify (longueurs réalistes)
+    token_info = {'access_token': 'B' * 300, 'token_type': 'Bearer', 'expires_in': 3600,
+                  'refresh_token': 'A' * 131, 'expires_at': int(time.time()) + 3600,
+                  'scope': ' '.join(f'user-scope-{i}' for i in range(14)) + ' playlist-read-private' * 3}
+    setups = [
+        # Configuration d'origine : fichiers, token complet, session réécrite à chaque requête
+        ('filesystem (avant)', 'filesystem', token_info, True),
+        ('filesystem', 'filesystem', compact_token(token_info), False),
+        ('memory', 'memory', compact_token(token_info), False),
+        ('redis', 'redis', compact_token(token_info), False),
+    ]
+    print(f"{args.requests} requêtes par mesure (lecture du token ; écriture : token rafraîchi à chaque requête)")
+    for label, backend, token, refresh_each_request in setups:
+        app = Flask(__name__)
+        app.secret_key = 'bench'
+        app.config['SESSION_FILE_DIR'] = tempfile.mkdtemp(prefix='uta-sessions-')
+        configure_sessions(app, backend, redis_url=os.getenv('REDIS_URL'))
+        app.config['SESSION_REFRESH_EACH_REQUEST'] = refresh_each_request
+        interface = app.session_interface
+        if backend == 'redis':
+            try:
+                interface.client.ping()
+            except Exception as e:
+                print(f"{label:>20}  ignoré (Redis injoignable : {e})")
+                continue
+
+        with app.test_request_context():
+            session = interface.open_session(app, request)
+            session['token_info'] = token
+            interface.save_session(app, session, app.response_class())
+        headers = {'Cookie': f'session={session.sid}'}
+
+        def one_request(write):
+            with app.test_request_context(headers=headers):
+                session = interface.open_session(app, request)
+                if write:
+                    session['token_info'] = dict(session['token_info'])
+                else:
+                    session.get('token_info')
+                interface.save_session(app, session, app.response_class())
+
+        def empty_request(_):
+            with app.test_request_context(headers=headers):
+                pass
+
+        _, baseline = timed(empty_request, range(args.requests))
+        _, reads = timed(lambda _: one_request(False), range(args.requests))
+        _, writes = timed(lambda _: one_request(True), range(args.requests))
+        if backend == 'memory':
+            size = interface.cache.size
+        elif backend == 'redis':
+            size = interface.client.strlen(interface._get_store_id(session.sid))
+        else:
+            size = sum(entry.stat().st_size for entry in os.scandir(app.config['SESSION_FILE_DIR']))
+        print(f"{label:>20}  lecture={1000 * (np.mean(reads) - np.mean(baseline)):.0f}µs  "
+              f"écriture={1000 * (np.mean(writes) - np.mean(baseline)):.0f}µs  stockée={size} octets")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks du backend Uta')
+    parser.add_argument('--data', default=DATA_PATH, help='Chemin vers data.csv')
+    parser.add_argument('--synthetic', type=int, default=0, help='Utiliser un catalogue synthétique de N chansons')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    recall = subparsers.add_parser('recall', help="Rappel et latence de l'index IVF face à la recherche exacte")
+    recall.add_argument('--k', type=int, default=9)
+    recall.add_argument('--queries', type=int, default=200)
+    recall.add_argument('--n-lists', type=int, default=None)
+    recall.set_defaults(func=bench_recall)
+
+    years = subparsers.add_parser('years', help="Index partitionné par année face à la recherche exacte")
+    years.add_argument('--k', type=int, default=9)
+    years.add_argument('--queries', type=int, default=200)
+    years.add_argument('--seeds', type=int, default=5)
+    years.add_argument('--spread', type=int, default=5)
+    years.set_defaults(func=bench_years)
+
+    knn = subparsers.add_parser('knn', help='Graphe kNN précalculé face à la recherche complète (1 et 2 chansons)')
+    knn.add_argument('--k', type=int, default=9)
+    knn.add_argument('--queries', type=int, default=200)
+    knn.add_argument('--graph-k', type=int, default=50)
+    knn.set_defaults(func=bench_knn)
+
+    memo = subparsers.add_parser('memo', help='Cache des recommandations sur des requêtes répétées (Zipf)')
+    memo.add_argument('--requests', type=int, default=5000)
+    memo.add_argument('--distinct', type=int, default=2000)
+    memo.add_argument('--zipf', type=float, default=1.2)
+    memo.set_defaults(func=bench_memo)
+
+    shards = subparsers.add_parser('shards', help='Recherche exacte répartie sur 1 à N processus (catalogues synthétiques)')
+    shards.add_argument('--rows', default='1000000,10000000')
+    shards.add_argument('--workers', default='1,2,4,8')
+    shards.add_argument('--queries', type=int, default=50)
+    shards.add_argument('--batch-size', type=int, default=256)
+    shards.set_defaults(func=bench_shards)
+
+    search = subparsers.add_parser('search', help='Latence de la recherche par titre/artiste (scan vs index)')
+    search.add_argument('--queries', default='l,lo,lov,love,love me,the,beat,queen,mozart,xq')
+    search.add_argument('--repeat', type=int, default=20)
+    search.set_defaults(func=bench_search)
+
+    batch = subparsers.add_parser('batch', help='Débit de search_batch face à K recherches séparées')
+    batch.add_argument('--k', type=int, default=9)
+    batch.add_argument('--batch-sizes', default='1,16,64,256')
+    batch.set_defaults(func=bench_batch)
+
+    format_parser = subparsers.add_parser('format', help='Coût par ligne du formatage JSON des résultats')
+    format_parser.add_argument('--sizes', default='9,100,1000')
+    format_parser.add_argument('--repeat', type=int, default=20)
+    format_parser.set_defaults(func=bench_format)
+
+    memory = subparsers.add_parser('memory', help='Mémoire du dataset par worker (CSV parsé vs cache mmap)')
+    memory.add_argument('--workers', type=int, default=4)
+    memory.add_argument('--cache-dir', default=CACHE_DIR)
+    memory.set_defaults(func=bench_memory)
+
+    fanout = subparsers.add_parser('fanout', help='Latence des recommandations Spotify face à un faux serveur Spotify')
+    fanout.add_argument('--latency', type=float, default=0.05, help='Latence simulée par appel, en secondes')
+    fanout.add_argument('--repeat', type=int, default=5)
+    fanout.set_defaults(func=bench_fanout)
+
+    connections = subparsers.add_parser('connections', help='Connexions ouvertes vers Spotify par requête')
+    connections.add_argument('--latency', type=float, default=0.002)
+    connections.add_argument('--requests', type=int, default=200)
+    connections.set_defaults(func=bench_connections)
+
+    pages = subparsers.add_parser('pages', help="Récupération d'une playlist paginée (séquentielle vs parallèle)")
+    pages.add_argument('--latency', type=float, default=0.05)
+    pages.add_argument('--playlist-size', type=int, default=2000)
+    pages.add_argument('--repeat', type=int, default=3)
+    pages.set_defaults(func=bench_pages)
+
+    ratelimit = subparsers.add_parser('ratelimit', help='Appels Spotify face à une limite de débit (429)')
+    ratelimit.add_argument('--latency', type=float, default=0.02)
+    ratelimit.add_argument('--api-rate', type=int, default=20, help='Appels par seconde acceptés par le faux serveur')
+    ratelimit.add_argument('--calls', type=int, default=200)
+    ratelimit.set_defaults(func=bench_ratelimit)
+
+    serve = subparsers.add_parser('serve', help='Test de charge : serveur Flask (threads) vs mode ASGI')
+    serve.add_argument('--latency', type=float, default=1.0)
+    serve.add_argument('--concurrency', default='100,400')
+    serve.add_argument('--requests', type=int, default=800)
+    serve.add_argument('--endpoints', default='/search_artists?query=love,/get_playlists')
+    serve.set_defaults(func=bench_serve)
+
+    sessions = subparsers.add_parser('sessions', help='Coût de la session par requête selon le stockage')
+    sessions.add_argument('--requests', type=int, default=2000)
+    sessions.set_defaults(func=bench_sessions)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
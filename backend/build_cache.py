@@ -0,0 +1,34 @@
+"""
+Prépare les caches binaires du backend à partir de data.csv (à lancer au déploiement
+ou après chaque mise à jour du dataset, pour que les workers démarrent sans parser le CSV) :
+
+    python build_cache.py [--force]
+"""
+import argparse
+import os
+import time
+from dataset import DATA_PATH, CACHE_DIR, build_dataset_cache, load_dataset
+from features import load_or_build_features
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Construit les caches binaires du dataset')
+    parser.add_argument('--data', default=DATA_PATH, help='Chemin vers data.csv')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--force', action='store_true', help='Reconstruire même si le cache est à jour')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    dataset_dir = os.path.join(args.cache_dir, 'dataset')
+    if args.force:
+        build_dataset_cache(args.data, dataset_dir)
+    dataset = load_dataset(args.data, dataset_dir)
+    print(f"Dataset : {len(dataset)} chansons ({dataset.signature}) en {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    load_or_build_features(dataset.frame, os.path.join(args.cache_dir, 'features'), dataset.signature)
+    print(f"Caractéristiques standardisées en {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
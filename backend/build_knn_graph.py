@@ -0,0 +1,38 @@
+"""
+Précalcule le graphe des plus proches voisins du dataset (à lancer au déploiement ou après chaque
+mise à jour du dataset, après build_cache.py ou au premier démarrage) :
+
+    python build_knn_graph.py [--k 50] [--chunk-size 256] [--workers N]
+
+Le calcul est découpé en blocs : relancé après une interruption, il reprend au premier bloc manquant.
+"""
+import argparse
+import os
+import time
+from dataset import DATA_PATH, CACHE_DIR, load_dataset
+from features import load_or_build_features
+from knn_graph import build_knn_graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Précalcule le graphe kNN du dataset')
+    parser.add_argument('--data', default=DATA_PATH, help='Chemin vers data.csv')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--k', type=int, default=50, help='Voisins gardés par chanson')
+    parser.add_argument('--chunk-size', type=int, default=256, help='Chansons par bloc')
+    parser.add_argument('--workers', type=int, default=None, help='Processus (par défaut : un par cœur)')
+    args = parser.parse_args()
+
+    # Le graphe est calculé sur la matrice du cache, identique à celle chargée par l'application
+    dataset = load_dataset(args.data, os.path.join(args.cache_dir, 'dataset'))
+    features_dir = os.path.join(args.cache_dir, 'features')
+    load_or_build_features(dataset.frame, features_dir, dataset.signature)
+
+    start = time.perf_counter()
+    graph = build_knn_graph(features_dir, os.path.join(args.cache_dir, 'knn'), k=args.k,
+                            chunk_size=args.chunk_size, workers=args.workers)
+    print(f"Graphe kNN : {graph.neighbors.shape[0]} x {graph.k} en {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class FanOut:
+    """
+    Exécute en parallèle des appels indépendants (typiquement des appels à l'API Spotify)
+    sur un pool de threads borné, partagé par toutes les requêtes.
+
+    Chaque appel en erreur, ou non terminé avant la fin du budget de temps, donne None :
+    le handler construit sa réponse avec les résultats partiels disponibles.
+    """
+
+    def __init__(self, max_workers=16, timeout=10.0):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fan-out')
+
+    def run(self, calls, timeout=None):
+        """
+        calls : liste de (description, fonction, args, kwargs).
+        Retourne la liste des résultats dans le même ordre (None en cas d'échec).
+        """
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        futures = [self._executor.submit(function, *args, **kwargs) for _, function, args, kwargs in calls]
+        results = []
+        for (description, _, _, _), future in zip(calls, futures):
+            try:
+                results.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+            except TimeoutError:
+                future.cancel()
+                print(f"Délai dépassé pour {description}")
+                results.append(None)
+            except Exception as e:
+                print(f"Erreur pour {description}: {e}")
+                results.append(None)
+        return results
+
+
+def call(description, function, *args, **kwargs):
+    """Raccourci pour construire un appel à passer à FanOut.run"""
+    return description, function, args, kwargs
+
+
+def fetch_all_pages(fan_out, first_page, fetch_page, description='la page'):
+    """
+    Récupère tous les éléments d'un résultat paginé Spotify à partir de sa première page.
+    La première page donne total et limit : les offsets restants sont tous connus,
+    les pages sont donc demandées en parallèle puis remises dans l'ordre.
+    fetch_page(offset, limit) renvoie la page commençant à offset.
+    Une page en échec est redemandée une fois directement (l'erreur remonte si elle échoue encore).
+    """
+    items = list(first_page['items'])
+    if not first_page.get('next'):
+        return items
+    limit = first_page['limit'] or len(items)
+    offsets = range(first_page['offset'] + limit, first_page['total'], limit)
+    pages = fan_out.run([call(f"{description} (offset {offset})", fetch_page, offset, limit) for offset in offsets])
+    for offset, page in zip(offsets, pages):
+        if page is None:
+            page = fetch_page(offset, limit)
+        items.extend(page['items'])
+    return items
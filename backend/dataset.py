@@ -0,0 +1,251 @@
+import ast
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(os.path.dirname(BACKEND_DIR), 'exploration', 'Version_finale', 'data', 'data.csv')
+CACHE_DIR = os.getenv('UTA_CACHE_DIR', os.path.join(BACKEND_DIR, 'cache'))
+
+# À incrémenter quand le format du cache binaire change
+CACHE_VERSION = 1
+
+
+def normalize_name(name):
+    return str(name).strip().lower()
+
+
+class SongLookup:
+    """
+    Index (nom, année) -> lignes du dataset, et id -> ligne, pour retrouver les chansons en O(1)
+    au lieu de parcourir toute la colonne name à chaque requête
+    """
+
+    def __init__(self, names, years, ids=None):
+        names = pd.Series(names, dtype=object).astype(str).str.strip().str.lower().tolist()
+        years = np.asarray(years, dtype=np.int64).tolist()
+        self._codes = {}
+        codes = np.fromiter((self._codes.setdefault(key, len(self._codes)) for key in zip(names, years)),
+                            dtype=np.int64, count=len(names))
+        self._row_codes = codes
+        # Lignes regroupées par clé : la clé c occupe order[offsets[c]:offsets[c + 1]], dans l'ordre du dataset
+        self._order = np.argsort(codes, kind='stable')
+        self._offsets = np.zeros(len(self._codes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(self._codes)), out=self._offsets[1:])
+        # En cas de doublon d'id, la première ligne l'emporte
+        self._ids = dict(zip(reversed(list(ids)), range(len(names) - 1, -1, -1))) if ids is not None else {}
+
+    @classmethod
+    def from_frame(cls, spotify_data):
+        ids = spotify_data['id'] if 'id' in spotify_data else None
+        return cls(spotify_data['name'], spotify_data['year'], ids)
+
+    def rows(self, name, year):
+        """Toutes les lignes correspondant à (nom, année), éventuellement vide"""
+        try:
+            code = self._codes.get((normalize_name(name), int(year)))
+        except (TypeError, ValueError):
+            code = None
+        if code is None:
+            return self._order[:0]
+        return self._group(code)
+
+    def same_song(self, row):
+        """Lignes ayant le même (nom, année) que la ligne donnée (doublons du dataset inclus)"""
+        return self._group(self._row_codes[row])
+
+    def _group(self, code):
+        return self._order[self._offsets[code]:self._offsets[code + 1]]
+
+    def find(self, song):
+        """Ligne de la chanson demandée ({'id'} ou {'name', 'year'}), ou None si elle est absente du dataset"""
+        song_id = song.get('id')
+        if song_id is not None and song_id in self._ids:
+            return self._ids[song_id]
+        rows = self.rows(song.get('name', ''), song.get('year'))
+        return int(rows[0]) if len(rows) else None
+
+
+class ArtistTable:
+    """
+    Artistes de chaque chanson, parsés une seule fois au chargement :
+    noms internés + ids au format CSR (les artistes de la ligne r sont ids[offsets[r]:offsets[r + 1]])
+    """
+
+    def __init__(self, names, ids, offsets):
+        self.names = tuple(names)
+        self.ids = np.asarray(ids, dtype=np.int32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.ids.flags.writeable = False
+        self.offsets.flags.writeable = False
+
+    @classmethod
+    def parse(cls, column):
+        """Construit la table depuis la colonne artists du CSV ("['Artiste 1', 'Artiste 2']")"""
+        interned = {}
+        ids = []
+        offsets = [0]
+        for raw in column:
+            for name in ast.literal_eval(raw) if isinstance(raw, str) else raw:
+                ids.append(interned.setdefault(name, len(interned)))
+            offsets.append(len(ids))
+        return cls(list(interned), ids, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def ids_of(self, row):
+        return self.ids[self.offsets[row]:self.offsets[row + 1]]
+
+    def __getitem__(self, row):
+        """Liste (nouvelle à chaque appel) des noms d'artistes de la ligne"""
+        return [self.names[i] for i in self.ids_of(row).tolist()]
+
+
+class Dataset:
+    """
+    Dataset des chansons chargé une seule fois au démarrage et partagé en lecture seule par les requêtes.
+    La colonne artists brute est remplacée par la table d'artistes déjà parsée.
+    """
+
+    def __init__(self, frame, artists, signature=''):
+        self.frame = frame
+        self.artists = artists
+        self.signature = signature
+        self.lookup = SongLookup.from_frame(frame)
+
+    def __len__(self):
+        return len(self.frame)
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def new_cache_dir(cache_dir):
+    """Dossier temporaire dans lequel écrire un cache avant de le publier avec publish_cache_dir"""
+    os.makedirs(os.path.dirname(os.path.abspath(cache_dir)), exist_ok=True)
+    tmp_dir = f"{cache_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    return tmp_dir
+
+
+def publish_cache_dir(tmp_dir, cache_dir):
+    """Remplace le cache : les workers qui ont déjà mappé l'ancien dossier gardent leurs fichiers"""
+    old_dir = f"{cache_dir}.old-{os.getpid()}"
+    if os.path.exists(cache_dir):
+        os.replace(cache_dir, old_dir)
+    os.replace(tmp_dir, cache_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _save_strings(path, values):
+    """Colonne texte stockée en un seul bloc UTF-8 (séparateur NUL), relu d'un seul decode()"""
+    blob = '\x00'.join(values).encode('utf-8')
+    np.save(path, np.frombuffer(blob, dtype=np.uint8))
+
+
+def _load_strings(path, n_rows):
+    if n_rows == 0:
+        return np.empty(0, dtype=object)
+    blob = np.load(path, mmap_mode='r')
+    return np.array(blob.tobytes().decode('utf-8').split('\x00'), dtype=object)
+
+
+def build_dataset_cache(csv_path, cache_dir, checksum=None):
+    """
+    Convertit data.csv en colonnes binaires .npy (lisibles en mmap) dans cache_dir.
+    Le manifest, écrit en dernier, contient le checksum du CSV pour invalider le cache.
+    """
+    checksum = checksum or file_checksum(csv_path)
+    frame = pd.read_csv(csv_path)
+    artists = ArtistTable.parse(frame.pop('artists'))
+
+    tmp_dir = new_cache_dir(cache_dir)
+
+    columns = []
+    for name in frame.columns:
+        if frame[name].dtype == object:
+            _save_strings(os.path.join(tmp_dir, f'{name}.npy'), frame[name].fillna('').astype(str))
+            columns.append([name, 'string'])
+        else:
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), frame[name].to_numpy())
+            columns.append([name, 'numeric'])
+    np.save(os.path.join(tmp_dir, 'artists.ids.npy'), artists.ids)
+    np.save(os.path.join(tmp_dir, 'artists.offsets.npy'), artists.offsets)
+    _save_strings(os.path.join(tmp_dir, 'artists.names.npy'), artists.names)
+
+    stat = os.stat(csv_path)
+    manifest = {
+        'version': CACHE_VERSION,
+        'checksum': checksum,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'rows': len(frame),
+        'artists': len(artists.names),
+        'columns': columns
+    }
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+
+    publish_cache_dir(tmp_dir, cache_dir)
+    return manifest
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _cache_is_fresh(manifest, csv_path):
+    if not manifest or manifest.get('version') != CACHE_VERSION:
+        return False
+    stat = os.stat(csv_path)
+    if (manifest['size'], manifest['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+        return True
+    # Date de modification différente : seul le contenu compte
+    return manifest['size'] == stat.st_size and manifest['checksum'] == file_checksum(csv_path)
+
+
+def load_cached_dataset(cache_dir):
+    """Charge le dataset depuis le cache binaire : colonnes numériques mappées en mémoire, sans copie"""
+    manifest = _read_manifest(cache_dir)
+    n_rows = manifest['rows']
+    columns = {}
+    for name, kind in manifest['columns']:
+        path = os.path.join(cache_dir, f'{name}.npy')
+        columns[name] = _load_strings(path, n_rows) if kind == 'string' else np.load(path, mmap_mode='r')
+    frame = pd.DataFrame(columns, copy=False)
+    artists = ArtistTable(
+        _load_strings(os.path.join(cache_dir, 'artists.names.npy'), manifest['artists']),
+        np.load(os.path.join(cache_dir, 'artists.ids.npy'), mmap_mode='r'),
+        np.load(os.path.join(cache_dir, 'artists.offsets.npy'), mmap_mode='r')
+    )
+    return Dataset(frame, artists, manifest['checksum'][:16])
+
+
+def load_dataset(path=DATA_PATH, cache_dir=None):
+    """
+    Charge le dataset. Avec cache_dir, le CSV n'est parsé que s'il a changé depuis la dernière
+    conversion ; sinon les colonnes binaires du cache sont mappées directement.
+    """
+    if cache_dir is None:
+        frame = pd.read_csv(path)
+        artists = ArtistTable.parse(frame.pop('artists'))
+        return Dataset(frame, artists, file_checksum(path)[:16])
+
+    if not _cache_is_fresh(_read_manifest(cache_dir), path):
+        print(f"Conversion de {path} en cache binaire ({cache_dir})")
+        build_dataset_cache(path, cache_dir)
+    return load_cached_dataset(cache_dir)
@@ -0,0 +1,89 @@
+import os
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+from dataset import new_cache_dir, publish_cache_dir
+
+# Caractéristiques numériques utilisées pour les recommandations
+NUMBER_COLS = ['valence', 'year', 'acousticness', 'danceability', 'duration_ms', 'energy',
+               'instrumentalness', 'key', 'liveness', 'loudness', 'mode', 'speechiness', 'tempo']
+
+
+def normalize_rows(matrix):
+    """Normalise chaque ligne (norme L2) pour que la distance cosinus devienne 1 - produit scalaire"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class FeatureMatrix:
+    """
+    Matrice des caractéristiques standardisées (float32), calculée une seule fois
+    et partagée en lecture seule par toutes les requêtes.
+    normalized contient les mêmes lignes normalisées (norme L2), utilisées par les index cosinus.
+    Chargées depuis le cache, les deux matrices sont mappées en mémoire : les pages sont
+    partagées entre tous les workers au lieu d'être copiées dans chacun.
+    """
+
+    def __init__(self, matrix, mean, scale, columns=NUMBER_COLS, signature='', normalized=None):
+        self.matrix = np.asarray(matrix, dtype=np.float32)
+        self.matrix.flags.writeable = False
+        self.normalized = np.asarray(normalized if normalized is not None else normalize_rows(self.matrix),
+                                     dtype=np.float32)
+        self.normalized.flags.writeable = False
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.columns = list(columns)
+        self.signature = signature
+
+    @classmethod
+    def fit(cls, spotify_data, columns=NUMBER_COLS, signature=''):
+        scaler = StandardScaler()
+        scaled = scaler.fit_transform(spotify_data[columns].to_numpy(dtype=np.float64))
+        return cls(scaled.astype(np.float32), scaler.mean_, scaler.scale_, columns, signature)
+
+    def transform(self, vectors):
+        """Standardise un ou plusieurs vecteurs de requête avec les paramètres du dataset"""
+        vectors = np.asarray(vectors, dtype=np.float64).reshape(-1, len(self.columns))
+        return ((vectors - self.mean) / self.scale).astype(np.float32)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def save(self, cache_dir):
+        tmp_dir = new_cache_dir(cache_dir)
+        np.save(os.path.join(tmp_dir, 'matrix.npy'), self.matrix)
+        np.save(os.path.join(tmp_dir, 'normalized.npy'), self.normalized)
+        np.savez(os.path.join(tmp_dir, 'params.npz'), mean=self.mean, scale=self.scale,
+                 columns=np.array(self.columns), signature=np.array(self.signature))
+        publish_cache_dir(tmp_dir, cache_dir)
+
+    @classmethod
+    def load(cls, cache_dir):
+        """Les matrices sont mappées en lecture seule (mmap), sans copie"""
+        with np.load(os.path.join(cache_dir, 'params.npz')) as params:
+            return cls(np.load(os.path.join(cache_dir, 'matrix.npy'), mmap_mode='r'),
+                       params['mean'], params['scale'], params['columns'].tolist(), str(params['signature']),
+                       normalized=np.load(os.path.join(cache_dir, 'normalized.npy'), mmap_mode='r'))
+
+
+def load_or_build_features(spotify_data, cache_dir, signature, columns=NUMBER_COLS):
+    """
+    Charge la matrice depuis le cache si elle correspond au dataset, sinon la recalcule et la sauvegarde
+    """
+    if os.path.exists(cache_dir):
+        try:
+            features = FeatureMatrix.load(cache_dir)
+            if (features.signature == signature and features.columns == list(columns)
+                    and len(features) == len(spotify_data)):
+                return features
+        except Exception as e:
+            print(f"Cache des caractéristiques invalide, reconstruction : {e}")
+
+    features = FeatureMatrix.fit(spotify_data, columns, signature)
+    try:
+        features.save(cache_dir)
+        return FeatureMatrix.load(cache_dir)
+    except OSError as e:
+        print(f"Impossible de sauvegarder le cache des caractéristiques : {e}")
+    return features
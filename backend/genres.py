@@ -0,0 +1,73 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+from dataset import DATA_PATH
+
+# Caractéristiques moyennes par genre, à côté de data.csv
+GENRES_PATH = os.path.join(os.path.dirname(DATA_PATH), 'data_by_genres.csv')
+
+
+def normalize_genre(genre):
+    """'Hip-Hop ' -> 'hip hop' (les seeds Spotify utilisent des tirets, le tableau des espaces)"""
+    return ' '.join(str(genre).strip().lower().replace('-', ' ').split())
+
+
+class GenreCentroids:
+    """
+    Tableau des centroïdes de genres (data_by_genres.csv), standardisés dans l'espace des
+    caractéristiques du dataset : une liste de genres devient un vecteur de requête pour l'index
+    de plus proches voisins, sans appel à Spotify.
+    Le tableau n'a pas de colonne year : l'année des centroïdes est l'année moyenne du dataset (neutre).
+    """
+
+    def __init__(self, names, centroids):
+        self.names = list(names)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.centroids.flags.writeable = False
+        self._rows = {normalize_genre(name): row for row, name in enumerate(self.names)}
+
+    @classmethod
+    def load(cls, features, path=GENRES_PATH):
+        table = pd.read_csv(path)
+        # Artistes sans genre
+        table = table[table['genres'].str.strip() != '[]']
+        columns = []
+        for position, column in enumerate(features.columns):
+            if column in table:
+                columns.append(table[column].to_numpy(dtype=np.float64))
+            else:
+                columns.append(np.full(len(table), features.mean[position]))
+        return cls(table['genres'].tolist(), features.transform(np.column_stack(columns)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def rows(self, genre):
+        """
+        Lignes du tableau correspondant à un genre : le genre lui-même, sinon tous les genres
+        qui contiennent ce mot ('acoustic' -> 'acoustic blues', 'acoustic pop'...)
+        """
+        genre = normalize_genre(genre)
+        if not genre:
+            return []
+        if genre in self._rows:
+            return [self._rows[genre]]
+        pattern = re.compile(rf'\b{re.escape(genre)}\b')
+        return [row for name, row in self._rows.items() if pattern.search(name)]
+
+    def query_vector(self, genres):
+        """
+        Vecteur de requête (standardisé) d'une liste de genres : moyenne des centroïdes des genres
+        reconnus, chaque genre comptant autant. Renvoie (vecteur ou None, genres inconnus)
+        """
+        vectors, unknown = [], []
+        for genre in genres:
+            rows = self.rows(genre)
+            if rows:
+                vectors.append(self.centroids[rows].mean(axis=0, dtype=np.float64))
+            else:
+                unknown.append(genre)
+        if not vectors:
+            return None, unknown
+        return np.mean(vectors, axis=0), unknown
@@ -0,0 +1,142 @@
+import os
+import shutil
+from multiprocessing import Pool
+import numpy as np
+from dataset import new_cache_dir, publish_cache_dir
+from features import FeatureMatrix, normalize_rows
+from neighbors import top_k
+
+
+class KNNGraph:
+    """
+    Graphe des plus proches voisins précalculé (build_knn_graph.py) : les K chansons les plus proches
+    (distance cosinus) de chaque chanson du dataset, triées, au format int32 (N, K) mappé en mémoire,
+    et la distance du K-ième voisin de chaque chanson (radius, float32).
+
+    Pour une ou deux chansons d'entrée, les listes de voisins des chansons d'entrée sont fusionnées
+    et seuls ces candidats sont comparés au vecteur moyen, au lieu de parcourir tout le dataset.
+    Une chanson absente de toutes les listes est plus loin que le K-ième voisin de chaque chanson
+    d'entrée, ce qui borne sa similarité avec le vecteur moyen : si le n-ième candidat fait mieux que
+    cette borne, le résultat est celui de la recherche complète, sinon la recherche complète est faite.
+    """
+
+    def __init__(self, neighbors, radius, features, signature=''):
+        self.neighbors = neighbors
+        self.radius = radius
+        self.features = features
+        self.signature = signature
+
+    @property
+    def k(self):
+        return self.neighbors.shape[1]
+
+    def search(self, rows, query, k, exclude=None):
+        """
+        Top k autour de query (moyenne des lignes rows de la matrice standardisée) parmi les voisins
+        précalculés de rows (indices, distances), ou None si les listes ne suffisent pas à garantir
+        le résultat de la recherche complète
+        """
+        if k <= 0:
+            return None
+        candidates = np.unique(self.neighbors[rows])
+        if exclude is not None and len(exclude):
+            candidates = candidates[~np.isin(candidates, exclude)]
+        if k > self.k or len(candidates) < k:
+            return None
+        query = np.asarray(query, dtype=np.float64).reshape(-1)
+        distances = self.features.normalized[candidates] @ normalize_rows(query.reshape(1, -1))[0]
+        np.subtract(1.0, distances, out=distances)
+        indices, distances = top_k(distances, k, candidates)
+
+        # Le vecteur moyen est la somme des chansons d'entrée pondérées par leur norme : la similarité
+        # d'une chanson hors des listes est au plus la moyenne pondérée des similarités des K-ièmes voisins
+        weights = np.linalg.norm(np.asarray(self.features.matrix[rows], dtype=np.float64), axis=1)
+        bound = weights @ (1.0 - np.asarray(self.radius[rows], dtype=np.float64)) / max(np.linalg.norm(query) * len(rows), 1e-12)
+        if 1.0 - distances[-1] < bound + 1e-6:
+            return None
+        return indices, distances
+
+    def save(self, cache_dir):
+        tmp_dir = new_cache_dir(cache_dir)
+        np.save(os.path.join(tmp_dir, 'neighbors.npy'), self.neighbors)
+        np.save(os.path.join(tmp_dir, 'radius.npy'), self.radius)
+        np.savez(os.path.join(tmp_dir, 'params.npz'), signature=np.array(self.signature))
+        publish_cache_dir(tmp_dir, cache_dir)
+
+    @classmethod
+    def load(cls, cache_dir, features):
+        with np.load(os.path.join(cache_dir, 'params.npz')) as params:
+            signature = str(params['signature'])
+        return cls(np.load(os.path.join(cache_dir, 'neighbors.npy'), mmap_mode='r'),
+                   np.load(os.path.join(cache_dir, 'radius.npy'), mmap_mode='r'), features, signature)
+
+
+def load_knn_graph(cache_dir, features):
+    """Graphe précalculé s'il existe et correspond au dataset, sinon None (recherche complète)"""
+    if not os.path.exists(cache_dir):
+        return None
+    try:
+        graph = KNNGraph.load(cache_dir, features)
+    except Exception as e:
+        print(f"Graphe kNN illisible, ignoré : {e}")
+        return None
+    if graph.signature != features.signature or len(graph.neighbors) != len(features):
+        print("Graphe kNN calculé pour une autre version du dataset, ignoré (relancer build_knn_graph.py)")
+        return None
+    return graph
+
+
+_worker_vectors = None
+
+
+def _init_worker(features_dir):
+    # Matrice mappée en mémoire : les pages sont partagées entre les processus, sans copie ni pickle
+    global _worker_vectors
+    _worker_vectors = FeatureMatrix.load(features_dir).normalized
+
+
+def _compute_chunk(task):
+    start, end, k, path = task
+    distances = _worker_vectors[start:end] @ _worker_vectors.T
+    np.subtract(1.0, distances, out=distances)
+    neighbors = np.empty((end - start, k), dtype=np.int32)
+    radius = np.empty(end - start, dtype=np.float32)
+    for offset, row_distances in enumerate(distances):
+        # La chanson elle-même n'est pas sa propre voisine
+        neighbors[offset], row_top = top_k(row_distances, k, exclude=np.array([start + offset]))
+        radius[offset] = row_top[-1]
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, neighbors=neighbors, radius=radius)
+    os.replace(tmp_path, path)
+    return end - start
+
+
+def build_knn_graph(features_dir, cache_dir, k=50, chunk_size=256, workers=None, progress=print):
+    """
+    Calcule le graphe kNN par blocs de chunk_size chansons, répartis sur un pool de processus.
+    Chaque bloc terminé est écrit dans un dossier de travail : une exécution interrompue reprend
+    là où elle s'était arrêtée. Le graphe complet est publié dans cache_dir à la fin.
+    """
+    features = FeatureMatrix.load(features_dir)
+    n_rows = len(features)
+    k = min(k, n_rows - 1)
+    work_dir = f"{cache_dir}.partial-k{k}-c{chunk_size}-{features.signature[:16]}"
+    os.makedirs(work_dir, exist_ok=True)
+
+    chunks = [(start, min(start + chunk_size, n_rows)) for start in range(0, n_rows, chunk_size)]
+    paths = [os.path.join(work_dir, f"chunk-{start:010d}.npz") for start, _ in chunks]
+    tasks = [(start, end, k, path) for (start, end), path in zip(chunks, paths) if not os.path.exists(path)]
+    progress(f"{n_rows} chansons, k={k} : {len(chunks) - len(tasks)}/{len(chunks)} blocs déjà calculés")
+
+    done = len(chunks) - len(tasks)
+    with Pool(workers, initializer=_init_worker, initargs=(features_dir,)) as pool:
+        for _ in pool.imap_unordered(_compute_chunk, tasks):
+            done += 1
+            if done % max(1, len(chunks) // 20) == 0 or done == len(chunks):
+                progress(f"{done}/{len(chunks)} blocs")
+
+    parts = [np.load(path) for path in paths]
+    KNNGraph(np.concatenate([part['neighbors'] for part in parts]),
+             np.concatenate([part['radius'] for part in parts]), features, features.signature).save(cache_dir)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return KNNGraph.load(cache_dir, features)
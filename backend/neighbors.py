@@ -0,0 +1,335 @@
+import hashlib
+import os
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from threadpoolctl import threadpool_limits
+from dataset import DATA_PATH, new_cache_dir, publish_cache_dir
+from features import FeatureMatrix, normalize_rows
+
+# Caractéristiques moyennes par année, à côté de data.csv
+YEARS_PATH = os.path.join(os.path.dirname(DATA_PATH), 'data_by_year.csv')
+
+
+def top_k(distances, k, candidates=None, exclude=None):
+    """
+    Retourne les k plus petites distances (indices, distances) triées, via argpartition.
+    Les lignes de exclude sont écartées après coup (on sélectionne k + len(exclude) lignes),
+    sans modifier ni recopier le tableau des distances.
+    À distance égale, l'ordre du dataset est conservé.
+    """
+    n_excluded = len(exclude) if exclude is not None else 0
+    wanted = min(k + n_excluded, len(distances))
+    if wanted <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=distances.dtype)
+    if wanted < len(distances):
+        part = np.argpartition(distances, wanted - 1)[:wanted]
+    else:
+        part = np.arange(len(distances))
+    positions = candidates[part] if candidates is not None else part
+    part_distances = distances[part]
+    if n_excluded:
+        kept = ~np.isin(positions, exclude)
+        positions, part_distances = positions[kept], part_distances[kept]
+    order = np.lexsort((positions, part_distances))[:k]
+    return positions[order], part_distances[order]
+
+
+class BruteForceIndex:
+    """
+    Index exact : calcule la distance cosinus vers toutes les chansons du dataset.
+    vectors : lignes déjà normalisées (FeatureMatrix.normalized), utilisées sans copie
+    """
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def search(self, query, k, exclude=None):
+        """Réentrant : seul le tableau des distances (local à la requête) est alloué"""
+        query = normalize_rows(np.asarray(query).reshape(1, -1))[0]
+        distances = self.vectors @ query
+        np.subtract(1.0, distances, out=distances)
+        return top_k(distances, k, exclude=exclude)
+
+    def search_batch(self, queries, k, excludes=None, block_size=64):
+        """
+        Recherche de plusieurs requêtes en un seul produit matriciel (BLAS) par bloc de block_size
+        requêtes, pour borner la mémoire à block_size x N distances
+        """
+        queries = normalize_rows(np.asarray(queries).reshape(len(queries), -1))
+        results = []
+        for start in range(0, len(queries), block_size):
+            distances = queries[start:start + block_size] @ self.vectors.T
+            np.subtract(1.0, distances, out=distances)
+            for offset, row_distances in enumerate(distances):
+                exclude = excludes[start + offset] if excludes is not None else None
+                results.append(top_k(row_distances, k, exclude=exclude))
+        return results
+
+
+class IVFIndex:
+    """
+    Index approximatif (inverted file) : les chansons sont regroupées en n_lists clusters k-means
+    et seuls les n_probe clusters les plus proches de la requête sont parcourus.
+    Augmenter n_probe améliore le rappel au prix de la latence.
+    vectors : lignes déjà normalisées (FeatureMatrix.normalized), utilisées sans copie
+    """
+
+    def __init__(self, vectors, n_lists=None, n_probe=16, seed=42, centroids=None, order=None, offsets=None):
+        self.vectors = vectors
+        self.n_probe = n_probe
+        if centroids is None:
+            n_lists = n_lists or max(1, int(np.sqrt(len(self.vectors))))
+            centroids, order, offsets = self._train(self.vectors, n_lists, seed)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.order = np.asarray(order)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @staticmethod
+    def _train(vectors, n_lists, seed):
+        n_lists = min(n_lists, len(vectors))
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=seed, batch_size=4096, n_init=3)
+        labels = kmeans.fit_predict(vectors)
+        centroids = normalize_rows(kmeans.cluster_centers_)
+        # Chansons triées par cluster : le cluster i occupe order[offsets[i]:offsets[i + 1]]
+        order = np.argsort(labels, kind='stable').astype(np.int32)
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=n_lists), out=offsets[1:])
+        return centroids, order, offsets
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def search(self, query, k, exclude=None, n_probe=None):
+        query = normalize_rows(np.asarray(query).reshape(1, -1))[0]
+        n_probe = n_probe or self.n_probe
+        n_excluded = len(exclude) if exclude is not None else 0
+        lists = np.argsort(1.0 - self.centroids @ query, kind='stable')
+
+        # Élargir la recherche tant qu'il n'y a pas assez de candidats pour remplir le top k
+        while True:
+            probed = lists[:n_probe]
+            candidates = np.concatenate([self.order[self.offsets[i]:self.offsets[i + 1]] for i in probed])
+            if len(candidates) >= k + n_excluded or n_probe >= self.n_lists:
+                break
+            n_probe *= 2
+
+        distances = self.vectors[candidates] @ query
+        np.subtract(1.0, distances, out=distances)
+        return top_k(distances, k, candidates, exclude)
+
+    def search_batch(self, queries, k, excludes=None):
+        # Chaque requête parcourt ses propres clusters : pas de produit matriciel commun
+        return [self.search(query, k, excludes[i] if excludes is not None else None)
+                for i, query in enumerate(queries)]
+
+    def save(self, cache_dir):
+        tmp_dir = new_cache_dir(cache_dir)
+        for name in ('centroids', 'order', 'offsets'):
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), getattr(self, name))
+        publish_cache_dir(tmp_dir, cache_dir)
+
+    @classmethod
+    def load(cls, cache_dir, vectors, n_probe=16):
+        arrays = {name: np.load(os.path.join(cache_dir, f'{name}.npy'), mmap_mode='r')
+                  for name in ('centroids', 'order', 'offsets')}
+        return cls(vectors, n_probe=n_probe, **arrays)
+
+
+class YearIndex(IVFIndex):
+    """
+    Index partitionné par année : une partition par année du dataset, résumée par sa ligne de
+    data_by_year.csv (caractéristiques moyennes de l'année, standardisées comme le dataset).
+    Les chansons d'entrée sont souvent de quelques décennies : seules les n_probe années dont le résumé
+    est le plus proche de la requête sont parcourues, la recherche s'élargit si le top k n'est pas rempli.
+    """
+
+    @classmethod
+    def build(cls, features, years, n_probe=16, path=YEARS_PATH):
+        years = np.asarray(years, dtype=np.int64)
+        partitions, labels = np.unique(years, return_inverse=True)
+        # Chansons triées par année : l'année i occupe order[offsets[i]:offsets[i + 1]]
+        order = np.argsort(labels, kind='stable').astype(np.int32)
+        offsets = np.zeros(len(partitions) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=len(partitions)), out=offsets[1:])
+
+        summary = pd.read_csv(path).set_index('year')
+        centroids = np.empty((len(partitions), len(features.columns)), dtype=np.float32)
+        for i, year in enumerate(partitions.tolist()):
+            if year in summary.index:
+                row = [year if column == 'year' else summary.at[year, column] for column in features.columns]
+                centroids[i] = features.transform(row)[0]
+            else:
+                # Année absente du résumé : moyenne de ses chansons
+                centroids[i] = features.matrix[order[offsets[i]:offsets[i + 1]]].mean(axis=0)
+        return cls(features.normalized, n_probe=n_probe, centroids=normalize_rows(centroids),
+                   order=order, offsets=offsets)
+
+    def __init__(self, vectors, sorted_vectors=None, **kwargs):
+        super().__init__(vectors, **kwargs)
+        # Copie des vecteurs triée par année : chaque partition est une tranche contiguë,
+        # parcourue par un produit matrice-vecteur sans rassembler les lignes.
+        # Chargée depuis le cache (load), elle est mappée en mémoire et partagée entre les workers
+        if sorted_vectors is None:
+            sorted_vectors = np.ascontiguousarray(self.vectors[self.order])
+            sorted_vectors.flags.writeable = False
+        self.sorted_vectors = sorted_vectors
+
+    def save(self, cache_dir):
+        tmp_dir = new_cache_dir(cache_dir)
+        for name in ('centroids', 'order', 'offsets', 'sorted_vectors'):
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), getattr(self, name))
+        publish_cache_dir(tmp_dir, cache_dir)
+
+    @classmethod
+    def load(cls, cache_dir, vectors, n_probe=16):
+        arrays = {name: np.load(os.path.join(cache_dir, f'{name}.npy'), mmap_mode='r')
+                  for name in ('centroids', 'order', 'offsets', 'sorted_vectors')}
+        return cls(vectors, n_probe=n_probe, **arrays)
+
+    def search(self, query, k, exclude=None, n_probe=None):
+        query = normalize_rows(np.asarray(query).reshape(1, -1))[0]
+        n_probe = n_probe or self.n_probe
+        n_excluded = len(exclude) if exclude is not None else 0
+        partitions = np.argsort(1.0 - self.centroids @ query, kind='stable')
+
+        # Élargir la recherche tant qu'il n'y a pas assez de candidats pour remplir le top k
+        while True:
+            probed = partitions[:n_probe]
+            if self.offsets[probed + 1].sum() - self.offsets[probed].sum() >= k + n_excluded \
+                    or n_probe >= self.n_lists:
+                break
+            n_probe *= 2
+
+        slices = [slice(self.offsets[i], self.offsets[i + 1]) for i in probed]
+        candidates = np.concatenate([self.order[part] for part in slices])
+        distances = np.concatenate([self.sorted_vectors[part] @ query for part in slices])
+        np.subtract(1.0, distances, out=distances)
+        return top_k(distances, k, candidates, exclude)
+
+
+_worker_vectors = None
+
+
+def _init_shard_worker(features_dir):
+    # Matrice mappée en mémoire : les pages sont partagées entre les processus, sans copie ni pickle.
+    # Un seul thread BLAS par processus : le parallélisme vient des shards
+    global _worker_vectors
+    threadpool_limits(1)
+    _worker_vectors = FeatureMatrix.load(features_dir).normalized
+
+
+def _search_shard(task):
+    start, end, queries, k, excludes, block_size = task
+    vectors = _worker_vectors[start:end]
+    results = []
+    # Par blocs de requêtes, pour borner la mémoire à block_size x taille du bloc de lignes
+    for block in range(0, len(queries), block_size):
+        distances = queries[block:block + block_size] @ vectors.T
+        np.subtract(1.0, distances, out=distances)
+        for row_distances, exclude in zip(distances, excludes[block:block + block_size]):
+            indices, row_top = top_k(row_distances, k, exclude=exclude)
+            results.append((indices + start, row_top))
+    return results
+
+
+class ShardedIndex:
+    """
+    Index exact réparti sur un pool de processus : la matrice normalisée est découpée en n_shards blocs
+    de lignes contiguës, chaque bloc renvoie son top k et les tops k des blocs sont fusionnés.
+    Les processus mappent la matrice du cache (features_dir) : seules les requêtes leur sont envoyées.
+    """
+
+    def __init__(self, features_dir, n_shards=None, workers=None):
+        self.features_dir = features_dir
+        self.n_rows = len(FeatureMatrix.load(features_dir))
+        self.workers = workers or os.cpu_count() or 1
+        n_shards = min(n_shards or self.workers, self.n_rows)
+        bounds = np.linspace(0, self.n_rows, n_shards + 1).astype(np.int64)
+        self.shards = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+        self._pool = Pool(self.workers, initializer=_init_shard_worker, initargs=(features_dir,))
+
+    def __len__(self):
+        return self.n_rows
+
+    def search(self, query, k, exclude=None):
+        return self.search_batch(np.asarray(query).reshape(1, -1), k, [exclude])[0]
+
+    def search_batch(self, queries, k, excludes=None, block_size=64):
+        queries = normalize_rows(np.asarray(queries).reshape(len(queries), -1))
+        excludes = [np.asarray(exclude if exclude is not None else [], dtype=np.int64)
+                    for exclude in (excludes if excludes is not None else [None] * len(queries))]
+        tasks = []
+        for start, end in self.shards:
+            # Exclusions de chaque bloc, en positions locales au bloc
+            local = [exclude[(exclude >= start) & (exclude < end)] - start for exclude in excludes]
+            tasks.append((start, end, queries, k, local, block_size))
+        shard_results = self._pool.map(_search_shard, tasks)
+
+        results = []
+        for position in range(len(queries)):
+            indices = np.concatenate([shard[position][0] for shard in shard_results])
+            distances = np.concatenate([shard[position][1] for shard in shard_results])
+            results.append(top_k(distances, k, indices))
+        return results
+
+    def close(self):
+        self._pool.terminate()
+
+
+def build_index(kind, features, cache_dir=None, n_lists=None, n_probe=16, years=None, workers=None):
+    """
+    Construit l'index de plus proches voisins demandé ('exact', 'ivf', 'year' ou 'sharded') sur la matrice
+    standardisée. 'year' a besoin de l'année de chaque chanson (years), 'sharded' de la matrice en cache
+    (cache_dir/features) et d'un nombre de processus (workers, par défaut un par cœur)
+    """
+    if kind == 'exact':
+        return BruteForceIndex(features.normalized)
+    if kind == 'sharded':
+        return ShardedIndex(os.path.join(cache_dir, 'features'), workers=workers)
+    if kind == 'year':
+        cache_path = None
+        if cache_dir:
+            # Les résumés par année dépendent aussi de data_by_year.csv
+            with open(YEARS_PATH, 'rb') as summary:
+                summary_hash = hashlib.sha256(summary.read()).hexdigest()[:12]
+            cache_path = os.path.join(cache_dir, f'year-{features.signature}-{summary_hash}')
+            if os.path.exists(cache_path):
+                try:
+                    return YearIndex.load(cache_path, features.normalized, n_probe=n_probe)
+                except Exception as e:
+                    print(f"Cache de l'index par année invalide, reconstruction : {e}")
+        index = YearIndex.build(features, years, n_probe=n_probe)
+        if cache_path:
+            try:
+                index.save(cache_path)
+                # Rechargé depuis le cache : la copie triée est mappée au lieu de rester en mémoire privée
+                return YearIndex.load(cache_path, features.normalized, n_probe=n_probe)
+            except OSError as e:
+                print(f"Impossible de sauvegarder l'index par année : {e}")
+        return index
+    if kind == 'ivf':
+        cache_path = None
+        if cache_dir:
+            cache_path = os.path.join(cache_dir, f'ivf-{n_lists or "auto"}-{features.signature}')
+            if os.path.exists(cache_path):
+                try:
+                    return IVFIndex.load(cache_path, features.normalized, n_probe=n_probe)
+                except Exception as e:
+                    print(f"Cache de l'index IVF invalide, reconstruction : {e}")
+        index = IVFIndex(features.normalized, n_lists=n_lists, n_probe=n_probe)
+        if cache_path:
+            try:
+                index.save(cache_path)
+            except OSError as e:
+                print(f"Impossible de sauvegarder l'index IVF : {e}")
+        return index
+    raise ValueError(f"Unknown nearest-neighbour index: {kind}")
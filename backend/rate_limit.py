@@ -0,0 +1,111 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from spotipy.exceptions import SpotifyException
+
+# Priorités des appels Spotify (la plus petite passe en premier quand il faut attendre)
+PRIORITY_SEARCH = 0       # recherches interactives (autocomplétion)
+PRIORITY_DEFAULT = 1      # pages de l'application
+PRIORITY_BACKGROUND = 2   # enrichissement (caractéristiques audio...)
+
+
+class RateLimiter:
+    """
+    Limiteur de débit partagé par tous les appels Spotify du processus (token bucket) :
+    `rate` appels par seconde en régime établi, jusqu'à `burst` d'un coup.
+
+    Quand Spotify répond 429, throttled(retry_after) suspend tous les appels jusqu'à la fin
+    du délai demandé, au lieu que chaque thread réessaie de son côté.
+    Un appel n'attend pas plus de `max_wait` secondes : au-delà, il échoue avec un 429
+    (et son Retry-After), comme si Spotify l'avait refusé.
+    Tant qu'un appel plus prioritaire attend, les appels moins prioritaires lui laissent la place.
+    """
+
+    def __init__(self, rate=20.0, burst=40, max_wait=10.0):
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting = defaultdict(int)
+        self._condition = threading.Condition()
+        self._stats = defaultdict(float)
+
+    def acquire(self, priority=PRIORITY_DEFAULT):
+        """Attend qu'un appel soit autorisé (lève SpotifyException 429 si l'attente dépasse max_wait)"""
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        with self._condition:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    higher_waiting = any(self._waiting[p] for p in self._waiting if p < priority)
+                    if now >= self._paused_until and self._tokens >= 1 and not higher_waiting:
+                        self._tokens -= 1
+                        self._record(priority, now - start)
+                        return
+                    # Prochain instant où l'appel pourrait passer
+                    ready_at = max(self._paused_until, now + max(0.0, 1 - self._tokens) / self.rate)
+                    if ready_at > deadline:
+                        self._stats['rejected'] += 1
+                        raise SpotifyException(429, -1, 'Rate limited (local limiter)',
+                                               headers={'Retry-After': str(math.ceil(ready_at - now))})
+                    self._condition.wait(max(ready_at - now, 1 / self.rate if higher_waiting else 0.001))
+            finally:
+                self._waiting[priority] -= 1
+                self._condition.notify_all()
+
+    def reserve(self, priority=PRIORITY_DEFAULT):
+        """
+        Version non bloquante d'acquire, pour le serveur asynchrone : prend un jeton et renvoie 0,
+        ou renvoie le nombre de secondes à attendre avant de réessayer
+        """
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            higher_waiting = any(self._waiting[p] for p in self._waiting if p < priority)
+            if now >= self._paused_until and self._tokens >= 1 and not higher_waiting:
+                self._tokens -= 1
+                self._stats['calls'] += 1
+                return 0.0
+            self._stats['deferred'] += 1
+            return max(self._paused_until - now, max(0.0, 1 - self._tokens) / self.rate, 0.001)
+
+    def throttled(self, retry_after):
+        """Spotify a répondu 429 : suspendre tous les appels pendant retry_after secondes"""
+        with self._condition:
+            self._stats['throttled'] += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._tokens = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _record(self, priority, waited):
+        self._stats['calls'] += 1
+        if waited > 0.001:
+            self._stats['queued'] += 1
+            self._stats['wait_seconds'] += waited
+            self._stats[f'queued_priority_{priority}'] += 1
+            self._stats[f'wait_seconds_priority_{priority}'] += waited
+
+    def snapshot(self):
+        with self._condition:
+            stats = {key: round(value, 3) if key.startswith('wait_seconds') else int(value)
+                     for key, value in self._stats.items()}
+            stats['paused_for'] = round(max(0.0, self._paused_until - time.monotonic()), 3)
+            stats['waiting'] = sum(self._waiting.values())
+            return stats
+
+
+def retry_after_seconds(error, default=1.0):
+    """Délai demandé par Spotify dans l'en-tête Retry-After d'une réponse 429"""
+    try:
+        return max(0.0, float(error.headers.get('Retry-After', default)))
+    except (TypeError, ValueError):
+        return default
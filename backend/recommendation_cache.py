@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """Calcul en cours d'une clé, attendu par les requêtes identiques arrivées entre-temps"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class RecommendationCache:
+    """
+    Cache en mémoire des recommandations du dataset, LRU borné en nombre d'entrées, avec expiration.
+    La clé est la liste triée des lignes des chansons d'entrée et n_songs : les mêmes chansons demandées
+    dans un autre ordre, avec une autre casse ou par id partagent la même entrée.
+
+    Les clés portent la signature du dataset : les résultats d'une autre version du dataset ne sont jamais
+    renvoyés. Les requêtes identiques simultanées attendent le calcul déjà en cours au lieu de le refaire.
+    """
+
+    def __init__(self, version, max_entries=10000, ttl=3600):
+        self.version = version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def key(self, rows, n_songs):
+        return self.version, int(n_songs), tuple(sorted(int(row) for row in rows))
+
+    def get_many(self, keys, compute):
+        """
+        Résultats des clés demandées : depuis le cache, depuis un calcul identique en cours dans un autre
+        thread, sinon calculés en un seul appel compute(clés manquantes) -> liste des résultats.
+        Les résultats sont partagés entre requêtes : ils ne doivent pas être modifiés.
+        """
+        results = [None] * len(keys)
+        leading = {}
+        waiting = []
+        now = time.monotonic()
+        with self._lock:
+            for position, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry[1] >= now:
+                        self._entries.move_to_end(key)
+                        results[position] = entry[0]
+                        self.hits += 1
+                        continue
+                    del self._entries[key]
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = leading[key] = _Flight()
+                    self.misses += 1
+                elif key not in leading:
+                    self.coalesced += 1
+                waiting.append((position, flight))
+
+        if leading:
+            try:
+                for flight, value in zip(leading.values(), compute(list(leading))):
+                    flight.value = value
+            except BaseException as e:
+                for flight in leading.values():
+                    flight.error = e
+                raise
+            finally:
+                expires_at = time.monotonic() + self.ttl
+                with self._lock:
+                    for key, flight in leading.items():
+                        del self._flights[key]
+                        if flight.error is None:
+                            self._store(key, flight.value, expires_at)
+                        flight.done.set()
+
+        for position, flight in waiting:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            results[position] = flight.value
+        return results
+
+    def _store(self, key, value, expires_at):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def snapshot(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'coalesced': self.coalesced}
@@ -0,0 +1,99 @@
+from collections import defaultdict
+import numpy as np
+from dataset import normalize_name
+
+
+def ngrams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _postings(texts, sizes):
+    """Index inversé n-gramme -> positions (triées) des textes qui le contiennent"""
+    postings = {n: defaultdict(list) for n in sizes}
+    for position, text in enumerate(texts):
+        for n in sizes:
+            for gram in ngrams(text, n):
+                postings[n][gram].append(position)
+    return {n: {gram: np.array(items, dtype=np.int32) for gram, items in grams.items()}
+            for n, grams in postings.items()}
+
+
+def _intersect(postings, grams):
+    lists = sorted((postings.get(gram) for gram in grams), key=lambda items: -1 if items is None else len(items))
+    if not lists or lists[0] is None:
+        return np.empty(0, dtype=np.int32)
+    result = lists[0]
+    for items in lists[1:]:
+        result = np.intersect1d(result, items, assume_unique=True)
+        if not len(result):
+            break
+    return result
+
+
+class TrackSearchIndex:
+    """
+    Index inversé (bigrammes et trigrammes) sur les titres et les noms d'artistes du dataset.
+
+    Les chansons sont numérotées par rang de popularité : les listes de l'index sont donc déjà
+    triées par pertinence, ce qui permet de s'arrêter dès que suffisamment de résultats sont trouvés.
+    Les résultats dont le titre ou un artiste commence par la requête passent en premier.
+    """
+
+    NGRAM_SIZES = (2, 3)
+
+    def __init__(self, names, artists, popularity=None):
+        """names : titres par ligne du dataset, artists : ArtistTable du dataset"""
+        names = list(names)
+        n_rows = len(names)
+        if popularity is not None:
+            self.rank_order = np.argsort(-np.asarray(popularity), kind='stable')
+        else:
+            self.rank_order = np.arange(n_rows)
+        self.names = [normalize_name(names[row]) for row in self.rank_order.tolist()]
+
+        # Artistes déjà internés par la table : on indexe chaque nom une seule fois,
+        # avec les rangs de ses chansons (l'artiste a occupe artist_ranks[artist_offsets[a]:artist_offsets[a + 1]])
+        self.artists = artists
+        self.artist_names = [normalize_name(name) for name in artists.names]
+        rank_of_row = np.empty(n_rows, dtype=np.int32)
+        rank_of_row[self.rank_order] = np.arange(n_rows, dtype=np.int32)
+        entry_ranks = rank_of_row[np.repeat(np.arange(n_rows), np.diff(artists.offsets))]
+        order = np.lexsort((entry_ranks, artists.ids))
+        self.artist_ranks = entry_ranks[order]
+        self.artist_offsets = np.zeros(len(self.artist_names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(artists.ids, minlength=len(self.artist_names)), out=self.artist_offsets[1:])
+
+        self._name_postings = _postings(self.names, self.NGRAM_SIZES)
+        self._artist_postings = _postings(self.artist_names, self.NGRAM_SIZES)
+
+    def _candidates(self, query):
+        """Rangs des chansons pouvant contenir la requête, triés par popularité"""
+        n = min(len(query), max(self.NGRAM_SIZES))
+        if n < min(self.NGRAM_SIZES):
+            return range(len(self.names))
+        grams = ngrams(query, n)
+        name_ranks = _intersect(self._name_postings[n], grams)
+        artist_ids = [artist_id for artist_id in _intersect(self._artist_postings[n], grams)
+                      if query in self.artist_names[artist_id]]
+        if not artist_ids:
+            return name_ranks
+        artist_ranks = [self.artist_ranks[self.artist_offsets[i]:self.artist_offsets[i + 1]] for i in artist_ids]
+        return np.union1d(name_ranks, np.concatenate(artist_ranks))
+
+    def search(self, query, limit=10):
+        """Retourne les lignes du dataset correspondant à la requête, les meilleures en premier"""
+        query = normalize_name(query)
+        if not query:
+            return []
+        prefix_matches, other_matches = [], []
+        for rank in self._candidates(query):
+            name = self.names[rank]
+            artist_names = [self.artist_names[i] for i in self.artists.ids_of(self.rank_order[rank]).tolist()]
+            if name.startswith(query) or any(artist.startswith(query) for artist in artist_names):
+                prefix_matches.append(rank)
+                if len(prefix_matches) >= limit:
+                    break
+            elif len(other_matches) < limit and (query in name or any(query in artist for artist in artist_names)):
+                other_matches.append(rank)
+        ranks = (prefix_matches + other_matches)[:limit]
+        return [int(self.rank_order[rank]) for rank in ranks]
@@ -0,0 +1,48 @@
+import msgspec
+import numpy as np
+
+# Champs renvoyés pour une chanson du dataset (recommandations et chansons d'entrée)
+SONG_FIELDS = ['name', 'year', 'artists', 'valence', 'acousticness', 'danceability', 'energy',
+               'instrumentalness', 'liveness', 'loudness', 'speechiness', 'tempo']
+
+# Champs renvoyés par la recherche dans le dataset
+TRACK_FIELDS = ['id', 'name', 'artists', 'year']
+
+_encoder = msgspec.json.Encoder()
+
+
+def song_records(dataset, rows, fields=SONG_FIELDS):
+    """
+    Convertit des lignes du dataset en liste de dicts prêts pour le JSON, colonne par colonne :
+    chaque colonne est extraite en une fois (tolist() convertit en int/float Python),
+    au lieu de parcourir les lignes avec iterrows() et de convertir chaque champ
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    columns = []
+    for field in fields:
+        if field == 'artists':
+            columns.append([dataset.artists[row] for row in rows.tolist()])
+        else:
+            columns.append(dataset.frame[field].to_numpy()[rows].tolist())
+    return [dict(zip(fields, values)) for values in zip(*columns)]
+
+
+def encode_json(payload):
+    """Encode la réponse en JSON avec msgspec (plus rapide que le sérialiseur JSON de Flask)"""
+    return _encoder.encode(payload)
+
+
+def spotify_track_records(dataset, rows):
+    """
+    Chansons du dataset au format des pistes de l'API Spotify (champs lus par le frontend),
+    pour les mélanger aux pistes renvoyées par Spotify. Le dataset n'a ni pochette ni extrait audio.
+    """
+    return [{
+        'id': record['id'],
+        'name': record['name'],
+        'artists': [{'name': artist} for artist in record['artists']],
+        'album': {'name': None, 'images': []},
+        'popularity': record['popularity'],
+        'preview_url': None,
+        'external_urls': {'spotify': f"https://open.spotify.com/track/{record['id']}"}
+    } for record in song_records(dataset, rows, ['id', 'name', 'artists', 'popularity'])]
@@ -0,0 +1,56 @@
+import redis
+from flask_session import Session
+from flask_session.base import ServerSideSessionInterface
+from flask_session._utils import total_seconds
+from spotify_cache import MemoryCache
+
+# Champs du token Spotify utilisés par le backend ; les autres (scope, token_type, expires_in)
+# ne sont pas gardés en session
+TOKEN_FIELDS = ('access_token', 'refresh_token', 'expires_at')
+
+
+def compact_token(token_info):
+    """Token réduit aux champs utiles, à stocker en session"""
+    return {field: token_info[field] for field in TOKEN_FIELDS if field in token_info}
+
+
+class MemorySessionInterface(ServerSideSessionInterface):
+    """
+    Sessions Flask-Session gardées en mémoire du processus (MemoryCache : LRU borné en octets,
+    expiration après PERMANENT_SESSION_LIFETIME), encodées en msgpack.
+    Pour un seul processus : les sessions sont perdues au redémarrage.
+    """
+
+    def __init__(self, app, cache, **kwargs):
+        self.cache = cache
+        super().__init__(app, **kwargs)
+
+    def _retrieve_session_data(self, store_id):
+        value = self.cache.get(store_id)
+        return self.serializer.decode(value) if value is not None else None
+
+    def _delete_session(self, store_id):
+        self.cache.delete(store_id)
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        self.cache.set(store_id, self.serializer.encode(session), total_seconds(session_lifetime))
+
+
+def configure_sessions(app, backend='memory', redis_url=None, max_bytes=16 * 1024 * 1024):
+    """
+    Installe le stockage de sessions demandé : 'memory' (un processus), 'redis' (partagé entre processus)
+    ou 'filesystem' (fichiers dans flask_session/).
+    La session n'est réécrite que si elle a été modifiée (rafraîchissement du token, pays...).
+    """
+    app.config['SESSION_REFRESH_EACH_REQUEST'] = False
+    if backend == 'memory':
+        app.session_interface = MemorySessionInterface(app, MemoryCache(max_bytes))
+        return
+    if backend == 'redis':
+        app.config['SESSION_TYPE'] = 'redis'
+        app.config['SESSION_REDIS'] = redis.Redis.from_url(redis_url or 'redis://localhost:6379/0')
+    elif backend == 'filesystem':
+        app.config['SESSION_TYPE'] = 'filesystem'
+    else:
+        raise ValueError(f"Unknown session backend: {backend}")
+    Session(app)
@@ -0,0 +1,185 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+import msgspec
+import redis
+
+# Méthodes spotipy mises en cache : (portée, durée de vie en secondes).
+# 'user' : réponse propre à l'utilisateur, 'global' : identique pour tous (artistes, albums...).
+# Les méthodes absentes (écritures, historique d'écoute...) ne sont jamais mises en cache.
+# audio_features est mis en cache piste par piste par AudioFeatureService (audio_features.py).
+SPOTIFY_CACHE_TTLS = {
+    'current_user': ('user', 300),
+    'current_user_playlists': ('user', 60),
+    'current_user_top_artists': ('user', 600),
+    'playlist': ('user', 120),
+    'playlist_tracks': ('user', 120),
+    'playlist_cover_image': ('global', 3600),
+    'artist': ('global', 3600),
+    'artists': ('global', 3600),
+    'artist_top_tracks': ('global', 3600),
+    'artist_albums': ('global', 3600),
+    'album_tracks': ('global', 86400),
+    # Résultats filtrés selon le pays du compte de l'utilisateur (appel sans market) : non partagés
+    'search': ('user', 600),
+    'next': ('user', 120),
+}
+
+
+class CacheStats:
+    """Compteurs de hits/misses par méthode"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    def record(self, method, hit):
+        with self._lock:
+            (self.hits if hit else self.misses)[method] += 1
+
+    def snapshot(self):
+        with self._lock:
+            methods = sorted(set(self.hits) | set(self.misses))
+            return {method: {'hits': self.hits[method], 'misses': self.misses[method]} for method in methods}
+
+
+class MemoryCache:
+    """
+    Cache en mémoire du processus, LRU borné en octets, avec expiration par entrée.
+    Les valeurs sont stockées encodées : chaque lecture renvoie un nouvel objet,
+    qu'un handler peut modifier sans corrompre le cache.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        value, _ = self._entries.pop(key)
+        self.size -= len(value)
+
+
+class RedisCache:
+    """
+    Cache Redis partagé entre processus. L'expiration utilise le TTL de Redis ;
+    la borne mémoire et l'éviction LRU se règlent côté serveur (maxmemory + allkeys-lru).
+    """
+
+    def __init__(self, client, prefix='uta:spotify:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            return self.client.get(self.prefix + key)
+        except redis.RedisError as e:
+            # Redis indisponible : se comporter comme un miss plutôt que faire échouer la requête
+            print(f"Erreur Redis (cache Spotify) : {e}")
+            return None
+
+    def set(self, key, value, ttl):
+        try:
+            self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+        except redis.RedisError as e:
+            print(f"Erreur Redis (cache Spotify) : {e}")
+
+
+def create_cache(backend, redis_url=None, max_bytes=64 * 1024 * 1024):
+    """Construit le cache demandé : 'memory', 'redis' ou 'none'"""
+    if backend == 'none':
+        return None
+    if backend == 'memory':
+        return MemoryCache(max_bytes)
+    if backend == 'redis':
+        return RedisCache(redis.Redis.from_url(redis_url or 'redis://localhost:6379/0'))
+    raise ValueError(f"Unknown Spotify cache backend: {backend}")
+
+
+def user_cache_key(token_info):
+    """Identifiant stable de l'utilisateur pour le cache (le refresh token survit aux rafraîchissements)"""
+    secret = token_info.get('refresh_token') or token_info.get('access_token', '')
+    return hashlib.sha256(secret.encode('utf-8')).hexdigest()[:16]
+
+
+def cache_key(user_key, name, scope, args, kwargs):
+    """Clé de cache d'un appel à la méthode spotipy `name`, ou None si l'appel ne peut pas être mis en cache"""
+    if name == 'next':
+        # Pagination : la page suivante est identifiée par son URL
+        page = args[0] if args else kwargs.get('result')
+        if not page or not page.get('next'):
+            return None
+        args, kwargs = (page['next'],), {}
+    owner = user_key if scope == 'user' else 'global'
+    try:
+        encoded_args = msgspec.json.encode([args, sorted(kwargs.items())])
+    except TypeError:
+        return None
+    return f"{owner}:{name}:{hashlib.sha256(encoded_args).hexdigest()[:24]}"
+
+
+class CachedSpotify:
+    """
+    Enveloppe un client spotipy.Spotify : les méthodes listées dans SPOTIFY_CACHE_TTLS
+    passent par le cache, les autres sont appelées directement
+    """
+
+    def __init__(self, client, cache, user_key, stats, ttls=SPOTIFY_CACHE_TTLS):
+        self._client = client
+        self._cache = cache
+        self._user_key = user_key
+        self._stats = stats
+        self._ttls = ttls
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if self._cache is None or name not in self._ttls or not callable(attribute):
+            return attribute
+        scope, ttl = self._ttls[name]
+
+        def cached_call(*args, **kwargs):
+            key = cache_key(self._user_key, name, scope, args, kwargs)
+            if key is None:
+                return attribute(*args, **kwargs)
+            value = self._cache.get(key)
+            if value is not None:
+                self._stats.record(name, hit=True)
+                return msgspec.json.decode(value)
+            self._stats.record(name, hit=False)
+            result = attribute(*args, **kwargs)
+            if result is not None:
+                self._cache.set(key, msgspec.json.encode(result), ttl)
+            return result
+
+        return cached_call
@@ -0,0 +1,139 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import spotipy
+from spotipy.exceptions import SpotifyException
+from urllib3.util.retry import Retry
+from rate_limit import PRIORITY_DEFAULT, retry_after_seconds
+
+
+def create_session(pool_size=32, retries=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504)):
+    """
+    Session HTTP partagée par tous les clients Spotify du processus : les connexions keep-alive
+    vers api.spotify.com sont réutilisées d'une requête à l'autre au lieu d'être rouvertes (TCP + TLS).
+    pool_size doit être au moins égal au nombre d'appels simultanés, sinon les connexions
+    en trop sont fermées après usage.
+    Les réponses 429 ne sont pas réessayées ici mais par PooledSpotify, via le limiteur partagé.
+    Une fois les tentatives épuisées, la dernière réponse 5xx est renvoyée telle quelle (raise_on_status=False) :
+    sinon spotipy la transformerait en 429 'Max Retries', prise à tort pour une limite de débit.
+    """
+    retry = Retry(
+        total=retries,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist,
+        respect_retry_after_header=False,
+        raise_on_status=False
+    )
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def connection_stats(session):
+    """Connexions ouvertes et requêtes envoyées par la session depuis le démarrage"""
+    opened = sent = 0
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                sent += pool.num_requests
+    return {
+        'connections_opened': opened,
+        'requests': sent,
+        'connections_per_1000_requests': round(1000 * opened / sent, 1) if sent else 0.0
+    }
+
+
+class PooledSpotify(spotipy.Spotify):
+    """
+    Client spotipy léger, créé par requête avec le token de l'utilisateur (en-tête Authorization
+    propre à chaque client), sur une session HTTP partagée qu'il ne doit pas fermer à sa destruction.
+
+    Chaque appel passe par le limiteur de débit partagé (RateLimiter) avec la priorité du client ;
+    une réponse 429 suspend tous les appels pendant le Retry-After, puis l'appel est réessayé
+    (au plus throttle_retries fois).
+    """
+
+    def __init__(self, *args, limiter=None, priority=PRIORITY_DEFAULT, throttle_retries=2, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+        self.priority = priority
+        self.throttle_retries = throttle_retries
+
+    def _internal_call(self, method, url, payload, params):
+        if self.limiter is None:
+            return super()._internal_call(method, url, payload, params)
+        for attempt in range(self.throttle_retries + 1):
+            self.limiter.acquire(self.priority)
+            try:
+                return super()._internal_call(method, url, payload, dict(params))
+            except SpotifyException as e:
+                # Seule une vraie réponse 429 (avec ses en-têtes) est une limite de débit
+                if e.http_status != 429 or e.headers is None or attempt == self.throttle_retries:
+                    raise
+                self.limiter.throttled(retry_after_seconds(e))
+
+    def __del__(self):
+        pass
+
+
+class TokenRefresher:
+    """
+    Rafraîchit les tokens d'accès Spotify sans effet de troupeau :
+    - un seul rafraîchissement en cours par utilisateur, les requêtes concurrentes attendent son résultat ;
+    - un token qui expire dans moins de `margin` secondes est rafraîchi en arrière-plan,
+      la requête continue avec le token actuel (encore valide) ;
+    - le dernier token obtenu est gardé pour les requêtes dont la session contient encore l'ancien.
+    Les utilisateurs sont identifiés par leur refresh token.
+    """
+
+    def __init__(self, oauth, margin=300, max_workers=2):
+        self._oauth = oauth
+        self.margin = margin
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='token-refresh')
+        # Réentrant : le callback de fin peut s'exécuter tout de suite, dans _refresh
+        self._lock = threading.RLock()
+        self._inflight = {}
+        self._latest = {}
+
+    def current(self, token_info):
+        """Token valide pour cet utilisateur (attend un rafraîchissement seulement si le token a expiré)"""
+        key = token_info['refresh_token']
+        with self._lock:
+            latest = self._latest.get(key)
+        if latest is not None and latest['expires_at'] > token_info['expires_at']:
+            token_info = latest
+
+        if self._oauth.is_token_expired(token_info):
+            return self._refresh(key).result()
+        if token_info['expires_at'] - time.time() < self.margin:
+            self._refresh(key)
+        return token_info
+
+    def _refresh(self, key):
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = self._executor.submit(self._oauth.refresh_access_token, key)
+                future.add_done_callback(lambda done: self._store(key, done))
+            return future
+
+    def _store(self, key, future):
+        with self._lock:
+            del self._inflight[key]
+            if future.exception() is not None:
+                print(f"Erreur lors du rafraîchissement du token : {future.exception()}")
+                return
+            now = time.time()
+            # Oublier les tokens expirés des utilisateurs qui ne reviennent plus
+            self._latest = {k: info for k, info in self._latest.items() if info['expires_at'] > now}
+            self._latest[key] = future.result()
@@ -0,0 +1,228 @@
+"""
+Faux serveur de l'API Spotify pour les benchmarks : répond aux endpoints utilisés par le backend
+avec des données déterministes, après une latence configurable (simulant l'aller-retour réseau).
+
+    stub = SpotifyStub(latency=0.05).start()
+    client = spotipy.Spotify(auth='stub')
+    client.prefix = stub.url
+"""
+import hashlib
+import json
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # File d'attente assez longue pour les connexions ouvertes en parallèle par le backend
+    request_queue_size = 256
+
+
+GENRES = ['pop', 'rock', 'jazz', 'hip-hop', 'classical', 'electronic', 'folk', 'metal']
+
+
+def _number(text, modulo):
+    return int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16) % modulo
+
+
+def fake_artist(artist_id):
+    return {
+        'id': artist_id,
+        'name': f'Artist {artist_id}',
+        'genres': [GENRES[_number(artist_id, len(GENRES))], GENRES[_number(artist_id + 'b', len(GENRES))]],
+        'images': [],
+        'external_urls': {'spotify': f'https://open.spotify.com/artist/{artist_id}'},
+    }
+
+
+def fake_track(track_id):
+    artist_id = f'a{_number(track_id, 500)}'
+    return {
+        'id': track_id,
+        'name': f'Track {track_id}',
+        'artists': [{'id': artist_id, 'name': f'Artist {artist_id}'}],
+        'album': {'name': f'Album {track_id}', 'images': []},
+        'popularity': _number(track_id, 100),
+        'preview_url': f'https://p.scdn.co/mp3-preview/{track_id}' if _number(track_id, 3) else None,
+        'external_urls': {'spotify': f'https://open.spotify.com/track/{track_id}'},
+    }
+
+
+def fake_audio_features(track_id):
+    return {
+        'id': track_id,
+        'danceability': _number(track_id + 'd', 1000) / 1000,
+        'energy': _number(track_id + 'e', 1000) / 1000,
+        'key': _number(track_id + 'k', 12),
+        'loudness': -_number(track_id + 'l', 60000) / 1000,
+        'mode': _number(track_id + 'm', 2),
+        'speechiness': _number(track_id + 's', 1000) / 1000,
+        'acousticness': _number(track_id + 'a', 1000) / 1000,
+        'instrumentalness': _number(track_id + 'i', 1000) / 1000,
+        'liveness': _number(track_id + 'v', 1000) / 1000,
+        'valence': _number(track_id + 'h', 1000) / 1000,
+        'tempo': 60 + _number(track_id + 't', 140000) / 1000,
+        'duration_ms': 120000 + _number(track_id + 'u', 240000),
+    }
+
+
+class SpotifyStub:
+    """
+    Serveur HTTP local (un thread par connexion) qui imite l'API Spotify.
+    Compte les requêtes et les connexions TCP reçues.
+    """
+
+    def __init__(self, latency=0.05, host='127.0.0.1', port=0, playlist_size=2000, n_playlists=120, rate_limit=None):
+        self.latency = latency
+        # Au-delà de rate_limit requêtes par seconde, répondre 429 avec Retry-After
+        self.rate_limit = rate_limit
+        self.throttled = 0
+        self._window = (0, 0)
+        self.playlist_size = playlist_size
+        self.n_playlists = n_playlists
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v1/'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def over_limit(self):
+        """Fenêtre fixe d'une seconde, comme une limite de débit côté API"""
+        if self.rate_limit is None:
+            return False
+        with self._lock:
+            second, count = self._window
+            now = int(time.monotonic())
+            count = count + 1 if now == second else 1
+            self._window = (now, count)
+            if count > self.rate_limit:
+                self.throttled += 1
+                return True
+            return False
+
+    def count(self, attribute):
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # En-têtes et corps sont écrits séparément : sans TCP_NODELAY, l'ACK retardé du client
+                # ajouterait ~40ms à chaque réponse sur une connexion réutilisée
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                stub.count('connections')
+
+            def do_GET(self):
+                stub.count('requests')
+                time.sleep(stub.latency)
+                parsed = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                if stub.over_limit():
+                    status, body = 429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}}
+                else:
+                    status, body = stub.route(parsed.path, query)
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                if status == 429:
+                    self.send_header('Retry-After', '1')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def page(self, path, items, total, query, default_limit):
+        """Page au format Spotify (items, total, offset, limit, next)"""
+        offset, limit = int(query.get('offset', 0)), int(query.get('limit', default_limit))
+        next_url = None
+        if offset + limit < total:
+            next_url = f'{self.url}{path}?offset={offset + limit}&limit={limit}'
+        return {'items': items(offset, min(offset + limit, total)), 'total': total,
+                'offset': offset, 'limit': limit, 'next': next_url}
+
+    def route(self, path, query):
+        path = (path[len('/v1/'):] if path.startswith('/v1/') else path.lstrip('/')).rstrip('/')
+        limit = int(query.get('limit', 20))
+
+        if path == 'me':
+            return 200, {'id': 'stub-user', 'display_name': 'Stub', 'country': 'FR'}
+        if path == 'me/player/recently-played':
+            return 200, {'items': [{'track': fake_track(f'r{i}')} for i in range(limit)]}
+        if path == 'me/top/artists':
+            return 200, {'items': [fake_artist(f'a{i}') for i in range(limit)]}
+        if path == 'me/playlists':
+            return 200, self.page(path, lambda start, end: [{
+                'id': f'p{i}', 'name': f'Playlist {i}', 'owner': {'display_name': 'Stub'},
+                'external_urls': {'spotify': f'https://open.spotify.com/playlist/p{i}'},
+            } for i in range(start, end)], self.n_playlists, query, 50)
+        if path == 'recommendations':
+            seeds = ','.join(query.get(key, '') for key in ('seed_artists', 'seed_tracks', 'seed_genres'))
+            return 200, {'tracks': [fake_track(f'r{_number(seeds, 10 ** 6)}x{i}') for i in range(limit)]}
+        if path == 'audio-features':
+            return 200, {'audio_features': [fake_audio_features(i) for i in query.get('ids', '').split(',') if i]}
+        if path == 'search':
+            kind = query.get('type', 'track')
+            items = [fake_artist(f'a{i}') if kind == 'artist' else fake_track(f's{i}') for i in range(limit)]
+            return 200, {kind + 's': {'items': items, 'total': limit}}
+        if path == 'artists':
+            return 200, {'artists': [fake_artist(i) for i in query.get('ids', '').split(',') if i]}
+
+        match = re.fullmatch(r'artists/([^/]+)/top-tracks', path)
+        if match:
+            return 200, {'tracks': [fake_track(f'{match.group(1)}t{i}') for i in range(10)]}
+        match = re.fullmatch(r'audio-features/([^/]+)', path)
+        if match:
+            return 200, fake_audio_features(match.group(1))
+        match = re.fullmatch(r'playlists/([^/]+)/tracks', path)
+        if match:
+            playlist_id = match.group(1)
+            return 200, self.page(path, lambda start, end: [
+                {'track': fake_track(f'{playlist_id}t{i}')} for i in range(start, end)
+            ], self.playlist_size, query, 100)
+        match = re.fullmatch(r'playlists/([^/]+)', path)
+        if match:
+            playlist_id = match.group(1)
+            tracks = self.page(f'playlists/{playlist_id}/tracks', lambda start, end: [
+                {'track': fake_track(f'{playlist_id}t{i}')} for i in range(start, end)
+            ], self.playlist_size, {}, 100)
+            return 200, {'id': playlist_id, 'name': f'Playlist {playlist_id}', 'tracks': tracks}
+        return 404, {'error': {'status': 404, 'message': 'Not found'}}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Faux serveur de l'API Spotify")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+    stub = SpotifyStub(latency=args.latency, port=args.port)
+    print(f"Faux serveur Spotify sur {stub.url}", flush=True)
+    stub._server.serve_forever()
@@ -1,4 +1,5 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import time
 
 import pandas as pd
@@ -35,6 +36,22 @@ sp_oauth = SpotifyOAuth(
 # Création de l'objet Spotify pour les requêtes
 sp = spotipy.Spotify(auth_manager=sp_oauth)
 
+# Nombre maximum de pages demandées en même temps à l'API
+MAX_PARALLEL_PAGES = 8
+
+# Fonction pour récupérer tous les éléments d'un résultat paginé
+def fetch_all_pages(first_page, fetch_page):
+    # La première page donne total et limit : les pages restantes sont demandées en parallèle, dans l'ordre
+    items = list(first_page["items"])
+    if not first_page["next"]:
+        return items
+    limit = first_page["limit"]
+    offsets = range(first_page["offset"] + limit, first_page["total"], limit)
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_PAGES) as executor:
+        for page in executor.map(lambda offset: fetch_page(offset, limit), offsets):
+            items.extend(page["items"])
+    return items
+
 # Fonction pour récupérer l'ID d'un artiste
 def get_artist_id(artists):
     try:
@@ -50,14 +67,8 @@ def get_artist_albums(artist_id):
     albums = []
     try:
         results = sp.artist_albums(artist_id, album_type="album,single", limit=50)
-    except Exception as e:
-        print(f"Erreur lors de la récupération des albums : {e}")
-        while results:
-            albums.extend(results["items"])
-            if results["next"]:
-                results = sp.next(results)
-            else:
-                break
+        albums = fetch_all_pages(results, lambda offset, limit: sp.artist_albums(
+            artist_id, album_type="album,single", limit=limit, offset=offset))
     except Exception as e:
         print(f"Erreur lors de la récupération des albums : {e}")
     return albums
@@ -66,13 +77,8 @@ def get_artist_albums(artist_id):
 def get_album_tracks(album_id):
     tracks = []
     try:
-        results = sp.album_tracks(album_id)
-        while results:
-            tracks.extend(results["items"])
-            if results["next"]:
-                results = sp.next(results)
-            else:
-                break
+        results = sp.album_tracks(album_id, limit=50)
+        tracks = fetch_all_pages(results, lambda offset, limit: sp.album_tracks(album_id, limit=limit, offset=offset))
     except Exception as e:
         print(f"Erreur lors de la récupération des morceaux : {e}")
     return tracks